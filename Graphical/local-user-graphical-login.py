@@ -26,14 +26,27 @@ and share the following setup steps:
         matchrule = <SUBJECT>.*CN=username.*
 """
 
+from SCAutolib.exceptions import SCAutolibNotFound
 from SCAutolib.models.authselect import Authselect
 from SCAutolib.models.gui import GUI
 from SCAutolib.models.log import assert_log
+import keyboard
 import pytest
-from time import sleep
+import re
+import threading
+from time import perf_counter, sleep
 from conftest import check_multicert
 
+# GUI restarts gdm and drives the physical seat (kmsgrab screenshots,
+# uinput keyboard and mouse). It can't be pointed at a headless display or
+# another seat, so graphical tests run one at a time on the physical seat,
+# serialized by the graphical_seat lock (see resources.py).
+pytestmark = [pytest.mark.graphical,
+              pytest.mark.writes("authselect", "cards")]
+
 SECURE_LOG = '/var/log/secure'
+# check_home_screen() waits up to 10 s for the home screen in each check
+HOME_SCREEN_CHECKS = 12
 
 
 @pytest.mark.parametrize("required", [(True), (False)])
@@ -212,3 +225,94 @@ def test_insert_card_prompt(local_user, lock_on_removal):
                 # Mandatory wait to switch display from GDM to GNOME
                 # Not waiting can actually mess up the output
                 gui.check_home_screen()
+
+
+class _LogWatcher(threading.Thread):
+    """Records the moment when a new line in the log file matches regex."""
+
+    def __init__(self, path, regex, interval=0.05):
+        super().__init__(name="log_watcher", daemon=True)
+        self.regex = re.compile(regex)
+        self.interval = interval
+        self.found = None
+        self._done = threading.Event()
+        self._file = open(path)
+        # Only new lines are interesting
+        self._file.seek(0, 2)
+
+    def run(self):
+        with self._file as f:
+            while not self._done.is_set():
+                for line in f:
+                    if self.regex.match(line):
+                        self.found = perf_counter()
+                        return
+                sleep(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.found
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("required", [(True), (False)])
+def test_login_with_sc_benchmark(local_user, benchmark, required):
+    """Measure time to desktop of GDM login with smart card.
+
+    The flow of test_login_with_sc is repeated --benchmark-iterations times,
+    each time with freshly started GDM. Every iteration is split into
+        pam     - from pressing enter after the PIN to the PAM success line
+                  in SECURE_LOG (SSSD and PAM)
+        session - from the PAM success line to the first successful
+                  check_home_screen() (GNOME session start)
+        total   - from pressing enter after the PIN to the home screen
+    Home screen is detected by screenshots and OCR, so the session phase is
+    precise only to the duration of one check.
+    """
+    expected_log = (
+        r'.* gdm-smartcard\]\[[0-9]+\]: '
+        r'pam_sss\(gdm-smartcard:auth\): authentication success;'
+        rf'.*user=({local_user.username}@shadowutils)?.*'
+    )
+    phases = {"pam": [], "session": [], "total": []}
+    failures = 0
+
+    with Authselect(required=required):
+        for _ in range(benchmark.iterations):
+            with (GUI(wait_time=10) as gui,
+                  local_user.card(insert=True) as sc):
+                check_multicert(gui=gui)
+                gui.assert_text('PIN', timeout=60)
+
+                gui.kb_write(sc.pin, press_enter=False)
+                watcher = _LogWatcher(SECURE_LOG, expected_log)
+                watcher.start()
+                pin_entered = perf_counter()
+                keyboard.send('enter')
+
+                home_screen = None
+                for _ in range(HOME_SCREEN_CHECKS):
+                    try:
+                        gui.check_home_screen()
+                    except SCAutolibNotFound:
+                        continue
+                    home_screen = perf_counter()
+                    break
+                pam_success = watcher.stop()
+
+            if home_screen is None or pam_success is None:
+                failures += 1
+                continue
+            phases["pam"].append(pam_success - pin_entered)
+            phases["session"].append(home_screen - pam_success)
+            phases["total"].append(home_screen - pin_entered)
+
+    for phase, latencies in phases.items():
+        benchmark.add(
+            "gdm_time_to_desktop",
+            {"user": local_user.username, "required": required,
+             "phase": phase},
+            latencies, failures=failures)
+    assert failures == 0, f"{failures} of {benchmark.iterations} logins " \
+                          "did not reach the desktop"
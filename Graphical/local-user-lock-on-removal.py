@@ -31,6 +31,13 @@ from time import sleep
 from conftest import check_multicert
 import pytest
 
+# GUI restarts gdm and drives the physical seat (kmsgrab screenshots,
+# uinput keyboard and mouse). It can't be pointed at a headless display or
+# another seat, so graphical tests run one at a time on the physical seat,
+# serialized by the graphical_seat lock (see resources.py).
+pytestmark = [pytest.mark.graphical,
+              pytest.mark.writes("authselect", "cards")]
+
 
 @pytest.mark.parametrize("required", [(True), (False)])
 def test_lock_on_removal(local_user, required):
@@ -1,36 +1,32 @@
-from http import server
 import re
 import ssl
-import threading
+from pathlib import Path
 from subprocess import check_output
-from time import sleep
 
 import pytest
+from python_freeipa.exceptions import DuplicateEntry
 
-from SCAutolib.models.file import File
+from SCAutolib import run
 from SCAutolib.models.user import IPAUser
 from SCAutolib.models.card import VirtualCard
-from SCAutolib.utils import _gen_private_key
-from SCAutolib.exceptions import SCAutolibException
+from cert_cache import CertCache, DEFAULT_PROFILE
 from conftest import ipa_server
+from ipa_client import IPABatch
+from tls_server import TLSServer
 
+pytestmark = pytest.mark.writes("cards")
 
-def _https_server(user_cert, user_key):
-    server_address = ("127.0.0.1", 8888)
-    httpd = server.HTTPServer(server_address, server.SimpleHTTPRequestHandler)
-    httpd.socket = ssl.wrap_socket(httpd.socket,
-                                   server_side=True,
-                                   certfile=str(user_cert),
-                                   keyfile=str(user_key),
-                                   ca_certs="/etc/ipa/ca.crt",
-                                   ssl_version=ssl.PROTOCOL_TLSv1_2,
-                                   cert_reqs=ssl.CERT_REQUIRED,
-                                   do_handshake_on_connect=True)
-    httpd.serve_forever()
+HTTPS_PORT = 8888
+HTTPS_BENCHMARK_PORT = 8889
+TLS_VERSIONS = {"tls1.2": ssl.TLSVersion.TLSv1_2,
+                "tls1.3": ssl.TLSVersion.TLSv1_3}
 
 
-@pytest.fixture
-def https_server(tmp_path):
+@pytest.fixture(scope="session")
+def https_server_cert(tmp_path_factory, request, key_pool):
+    """Hostname of the HTTPS server and paths to its certificate and key
+    issued by IPA."""
+    tmp_path = tmp_path_factory.mktemp("https-server")
     https_user_card = VirtualCard({
         "name": "virt-card-2",
         "pin": "123456",
@@ -47,51 +43,158 @@ def https_server(tmp_path):
 
     https_user_card.user = https_user
 
-    try:
-        https_user.add_user()
-    except SCAutolibException:
-        pass
-    key = tmp_path.joinpath("https-server-key.pem")
-    _gen_private_key(key)
-    https_user_card.key = key
-    csr = https_user_card.gen_csr()
-    cert_out = tmp_path.joinpath("cert.pem")
-    ipa_server.request_cert(csr, https_user.username, cert_out)
-
-    hosts = File("/etc/hosts")
-    with hosts.path.open("a") as f:
-        f.write(f"127.0.0.1 {https_user.username}")
-    try:
-        server_t = threading.Thread(name='daemon_server',
-                                    args=(cert_out, https_user_card.key),
-                                    daemon=True,
-                                    target=_https_server)
-        server_t.start()
-
-        sleep(5)
-        yield https_user.username
-        server_t.join(timeout=1)
-    finally:
-        ipa_server.del_user(https_user)
-
-
-def test_access_secure_webpage_on_https(ipa_user, https_server, root_shell, tmpdir):
-    """Test that kerberos user is asked for PIN when accessing a secure webpage"""
-    check_output(["certutil", "-N", "-d", tmpdir, "--empty-password"], encoding="utf-8")
+    # Server certificate is reused between runs as long as it is valid. The
+    # user is therefore kept on the IPA server, deleting it would revoke the
+    # certificate.
+    subject = f"CN={https_user_card.CN}"
+    cert_cache = CertCache(request.config.cache.mkdir("ipa-certs"),
+                           ipa_server)
+    cached = cert_cache.get(subject)
+    if cached is None:
+        key = key_pool.take(tmp_path.joinpath("https-server-key.pem"))
+        https_user_card.key = key
+        csr = https_user_card.gen_csr()
+
+        # The user only serves as a principal for the certificate, so it is
+        # created together with the certificate request in one IPA request
+        with IPABatch(ipa_server) as batch:
+            batch.add("user_add", https_user.username,
+                      givenname=https_user.username, sn=https_user.username,
+                      cn=https_user.username, ignore=[DuplicateEntry])
+            cert_call = batch.add("cert_request", csr.read_text(),
+                                  principal=https_user.username,
+                                  profile_id=DEFAULT_PROFILE)
+        cert = batch.results[cert_call]["result"]["certificate"]
+        cached = cert_cache.put(subject, cert, key)
+    cert_out, https_user_card.key = cached
+
+    return https_user.username, cert_out, https_user_card.key
 
-    check_output(["certutil", "-A", "-n", "ipa-ca", "-t", 'TC,C,T', "-d", tmpdir,
+
+@pytest.fixture
+def https_host(https_server_cert):
+    """Hostname of the HTTPS server resolved to localhost by /etc/hosts.
+
+    The entry is added for each test and removed after it, so it doesn't
+    depend on /etc/hosts kept unchanged between tests (e.g. by
+    --etc-restore).
+    """
+    hostname = https_server_cert[0]
+    hosts = Path("/etc/hosts")
+    content = hosts.read_text()
+    entry = f"127.0.0.1 {hostname}\n"
+    added = entry not in content.splitlines(keepends=True)
+    if added:
+        separator = "" if not content or content.endswith("\n") else "\n"
+        with hosts.open("a") as f:
+            f.write(separator + entry)
+    yield hostname
+    if added:
+        lines = hosts.read_text().splitlines(keepends=True)
+        if entry in lines:
+            lines.remove(entry)
+            hosts.write_text("".join(lines))
+
+
+@pytest.fixture(scope="session")
+def https_server(https_server_cert):
+    hostname, cert, key = https_server_cert
+    with TLSServer(("127.0.0.1", HTTPS_PORT), cert, key, "/etc/ipa/ca.crt"):
+        yield hostname
+
+
+@pytest.fixture(scope="session")
+def nss_db_template(tmp_path_factory):
+    """NSS database with IPA CA certificate, created once per session."""
+    db = tmp_path_factory.mktemp("nssdb")
+    check_output(["certutil", "-N", "-d", db, "--empty-password"], encoding="utf-8")
+
+    check_output(["certutil", "-A", "-n", "ipa-ca", "-t", 'TC,C,T', "-d", db,
                  "-i", "/etc/ipa/ca.crt"], encoding="utf-8")
+    return db
+
+
+@pytest.fixture
+def nss_db(nss_db_template, tmp_path):
+    """Copy of NSS database template for the test. The copy is reflinked
+    when the file system supports it."""
+    db = tmp_path.joinpath("nssdb")
+    check_output(["cp", "-a", "--reflink=auto", nss_db_template, db],
+                 encoding="utf-8")
+    return db
 
+
+def _card_uri(user, nss_db):
+    out = check_output(["modutil", "-list", "-dbdir", nss_db], encoding="utf-8")
+    uri = re.findall(rf"uri:\s(.*{user.username}.*)\n", out)
+    assert len(uri) == 1, f"Only one URI should be present in the " \
+                          f"database. Found URIs: {uri}"
+    return uri[0]
+
+
+def test_access_secure_webpage_on_https(ipa_user, https_server, https_host,
+                                        root_shell, nss_db):
+    """Test that kerberos user is asked for PIN when accessing a secure webpage"""
     with ipa_user.card(insert=True):
-        out = check_output(["modutil", "-list", "-dbdir", tmpdir], encoding="utf-8")
-        uri = re.findall(rf"uri:\s(.*{ipa_user.username}.*)\n", out)
-        assert len(uri) == 1, f"Only one URI should be present in the " \
-                              f"database. Found URIs: {uri}"
-        uri = uri[0]
+        uri = _card_uri(ipa_user, nss_db)
         nss_client = "/usr/lib64/nss/unsupported-tools/tstclnt"
 
-        cmd = f'{nss_client} -n "{uri}" -d {tmpdir} -p 8888 -h {https_server} -V tls1.2: -Q'
+        cmd = f'{nss_client} -n "{uri}" -d {nss_db} -p {HTTPS_PORT} -h {https_host} -V tls1.2: -Q'
         root_shell.sendline(cmd)
         root_shell.expect_exact(f'Enter Password or Pin for "{ipa_user.username}":', timeout=20)
         root_shell.sendline(ipa_user.pin)
         root_shell.expect_exact("Received 0 Cert Status items (OCSP stapled data)", timeout=20)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("resumption", [False, True])
+@pytest.mark.parametrize("tls_version", ["tls1.2", "tls1.3"])
+def test_https_handshake_benchmark(ipa_user, https_server_cert, https_host,
+                                   nss_db, benchmark, tls_version, resumption):
+    """Measure TLS client authentication handshakes with the card key.
+
+    NSS stress client (strsclnt) makes --benchmark-iterations handshakes
+    with the certificate and key on the card, first sequentially and then
+    from --benchmark-concurrency threads. Handshake latency and throughput
+    are measured on the server, from the start of the handshake to its
+    completion, so they don't include startup of the client. Without
+    resumption every handshake is a full one (strsclnt -N).
+    """
+    _, cert, key = https_server_cert
+    hostname = https_host
+    iterations = benchmark.iterations
+    version = TLS_VERSIONS[tls_version]
+    stress_client = "/usr/lib64/nss/unsupported-tools/strsclnt"
+
+    with (TLSServer(("127.0.0.1", HTTPS_BENCHMARK_PORT), cert, key,
+                    "/etc/ipa/ca.crt", min_version=version,
+                    max_version=version) as server,
+          ipa_user.card(insert=True)):
+        uri = _card_uri(ipa_user, nss_db)
+        for mode, threads in (("sequential", 1),
+                              ("concurrent", benchmark.concurrency)):
+            server.reset_stats()
+            cmd = [stress_client, "-n", uri, "-d", nss_db,
+                   "-p", str(HTTPS_BENCHMARK_PORT), "-w", ipa_user.pin,
+                   "-c", str(iterations), "-t", str(threads),
+                   "-V", f"{tls_version}:{tls_version}"]
+            if not resumption:
+                cmd.append("-N")
+            cmd.append(hostname)
+            run(cmd, check=False)
+
+            handshakes = server.handshakes
+            duration = None
+            if handshakes:
+                duration = max(h.end for h in handshakes) - \
+                    min(h.start for h in handshakes)
+            benchmark.add(
+                "https_handshake",
+                {"tls_version": tls_version, "resumption": resumption,
+                 "mode": mode, "threads": threads},
+                [h.end - h.start for h in handshakes],
+                failures=iterations - len(handshakes),
+                duration=duration,
+                resumed=sum(h.reused for h in handshakes))
+            assert len(handshakes) == iterations, \
+                f"{iterations - len(handshakes)} handshakes failed"
@@ -4,7 +4,8 @@ import pexpect
 import pytest
 
 from SCAutolib.models.authselect import Authselect
-from SCAutolib.utils import isDistro
+
+pytestmark = pytest.mark.writes("authselect", "cards")
 
 
 def test_krb_user_ssh(ipa_user, user_shell):
@@ -54,7 +55,7 @@ def test_krb_user_scp_required(ipa_user, user_shell):
 
 
 @pytest.mark.parametrize("ipa_login", [True, False])
-def test_krb_change_passwd_ssh(ipa_user, user_shell, ipa_login):
+def test_krb_change_passwd_ssh(ipa_user, user_shell, capabilities, ipa_login):
     with Authselect(required=False), ipa_user.card(insert=True):
         if ipa_login:
             user_shell.sendline(f"su - {ipa_user.username}")
@@ -66,10 +67,7 @@ def test_krb_change_passwd_ssh(ipa_user, user_shell, ipa_login):
         user_shell.sendline(f"whoami")
         user_shell.expect_exact(ipa_user.username)
         user_shell.sendline(f"passwd")
-        if isDistro(['rhel', 'centos'], '>=10') or isDistro('fedora', '>=40'):
-            user_shell.expect(r"[cC]urrent [pP]assword")
-        else:
-            user_shell.expect_exact(f"Changing password for user {ipa_user.username}.")
+        user_shell.expect(capabilities.passwd_prompt(ipa_user.username))
 
 
 # Login with kerberos user using a smart card and then check if we can still ssh into the system
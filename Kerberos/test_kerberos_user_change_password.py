@@ -2,7 +2,8 @@ import pytest
 
 import conftest
 from SCAutolib.models.authselect import Authselect
-from SCAutolib.utils import isDistro
+
+pytestmark = pytest.mark.writes("authselect", "cards")
 
 
 @pytest.mark.parametrize("required,insert,expect,secret",
@@ -10,7 +11,7 @@ from SCAutolib.utils import isDistro
                           (False, True, f"PIN for {conftest.ipa_user.username}:", conftest.ipa_user.pin),
                           (True, False, "Password:", conftest.ipa_user.password),
                           (True, True, f"PIN for {conftest.ipa_user.username}: ", conftest.ipa_user.pin)])
-def test_kerberos_change_passwd(ipa_user, user_shell, required, insert, expect, secret):
+def test_kerberos_change_passwd(ipa_user, user_shell, capabilities, required, insert, expect, secret):
     """Kerberos user tries to change it kerberos password after he is logged
     in to the system.
 
@@ -67,7 +68,4 @@ def test_kerberos_change_passwd(ipa_user, user_shell, required, insert, expect,
             user_shell.sendline(cmd)
             user_shell.expect_exact(expect)
             user_shell.sendline(secret)
-            if isDistro(['rhel', 'centos'], '>=10') or isDistro('fedora', '>=40'):
-                user_shell.expect(r"[cC]urrent [pP]assword")
-            else:
-                user_shell.expect_exact(f"Changing password for user {ipa_user.username}.")
+            user_shell.expect(capabilities.passwd_prompt(ipa_user.username))
@@ -4,6 +4,8 @@ import pytest
 from SCAutolib import run
 from SCAutolib.models.authselect import Authselect
 
+pytestmark = pytest.mark.writes("authselect", "cards")
+
 
 def test_smart_card_gdm_login_enforcing(ipa_user, root_shell):
     """Test kerberos user tries to login to the GDM with smart card. Smart
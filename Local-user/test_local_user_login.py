@@ -3,9 +3,11 @@ do not require any credentials!
 """
 import re
 import pytest
-from conftest import check_multicert
+from conftest import check_multicert, enter_pin
 from SCAutolib.models.authselect import Authselect
 
+pytestmark = pytest.mark.writes("authselect", "cards")
+
 @pytest.mark.parametrize("required", [True, False])
 def test_su_login_with_sc(local_user, user_shell, required):
     """Basic su login to the user with a smart card.
@@ -46,9 +48,7 @@ def test_su_login_with_sc(local_user, user_shell, required):
             with getattr(local_user, f"card_{i}")(insert=True) as sc:
                 cmd = f'su {local_user.username} -c "whoami"'
                 user_shell.sendline(cmd)
-                check_multicert(shell=user_shell)
-                user_shell.expect(f"PIN for.*{re.escape(sc.label)}.*:")
-                user_shell.sendline(sc.pin)
+                enter_pin(user_shell, sc)
                 user_shell.expect_exact(local_user.username)
 
 
@@ -0,0 +1,175 @@
+"""Load test of concurrent smart card logins of the local user.
+
+Many 'su' logins with the smart card run at the same time against the local
+SSSD. Prompts are handled the same way as in test_su_login_with_sc. The test is
+executed only with --benchmark. Each concurrency level (1, 2, 4, ... up to
+--benchmark-concurrency) makes --benchmark-iterations logins.
+
+While logins are running, p11_child and pcscd processes are sampled from /proc
+to show how they behave as concurrency grows.
+"""
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+from time import perf_counter, sleep
+
+import pexpect
+import pytest
+
+from SCAutolib.models.authselect import Authselect
+from conftest import enter_pin
+
+log = logging.getLogger("PyTest")
+
+pytestmark = pytest.mark.writes("authselect", "cards")
+
+# Printed by the command run by su, i.e. only after a successful login. A
+# failed su doesn't run the command, so the worker waits for DONE until the
+# timeout. The echoed command line doesn't match as $? is expanded by the
+# shell of the user.
+DONE = "SC-LOGIN-0"
+
+
+def _processes(name):
+    """Return PIDs of processes with given name."""
+    pids = []
+    for proc in Path("/proc").iterdir():
+        if not proc.name.isdigit():
+            continue
+        try:
+            if proc.joinpath("comm").read_text().strip() == name:
+                pids.append(int(proc.name))
+        except OSError:
+            # process has exited in the meantime
+            continue
+    return pids
+
+
+def _cpu_time(pid):
+    """Return user + system CPU time of the process in seconds."""
+    stat = Path(f"/proc/{pid}/stat").read_text()
+    # fields after the command name, which can contain spaces
+    fields = stat[stat.rindex(")") + 2:].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _rss(pid):
+    """Return resident set size of the process in kB."""
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1])
+    return 0
+
+
+class _ProcessSampler(threading.Thread):
+    """Samples p11_child and pcscd processes until stopped."""
+
+    def __init__(self, interval=0.1):
+        super().__init__(name="process_sampler", daemon=True)
+        self.interval = interval
+        self.max_p11_child = 0
+        self.pcscd_max_rss = 0
+        self._done = threading.Event()
+        pcscd = _processes("pcscd")
+        self._pcscd = pcscd[0] if pcscd else None
+        self._pcscd_cpu = _cpu_time(self._pcscd) if self._pcscd else 0
+
+    def run(self):
+        while not self._done.is_set():
+            self.max_p11_child = max(self.max_p11_child,
+                                     len(_processes("p11_child")))
+            if self._pcscd:
+                self.pcscd_max_rss = max(self.pcscd_max_rss,
+                                         _rss(self._pcscd))
+            sleep(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return {
+            "max_p11_child": self.max_p11_child,
+            "pcscd_cpu": (_cpu_time(self._pcscd) - self._pcscd_cpu
+                          if self._pcscd else None),
+            "pcscd_max_rss_kb": self.pcscd_max_rss,
+        }
+
+
+def _login_worker(user, sc, logins, latencies, failures):
+    shell = pexpect.spawn("/usr/bin/sh -c 'su base-user'", encoding="utf-8")
+    try:
+        while True:
+            try:
+                logins.get_nowait()
+            except queue.Empty:
+                return
+            start = perf_counter()
+            shell.sendline(f'su {user.username} -c "whoami; echo SC-LOGIN-$?"')
+            try:
+                enter_pin(shell, sc)
+                shell.expect_exact(DONE)
+            except Exception as e:
+                # e.g. TIMEOUT of a failed login or AssertionError of
+                # enter_pin on an unexpected prompt, counted as a failure
+                # instead of ending the worker
+                log.warning("Login failed: %r", e)
+                failures.append(start)
+                if shell.isalive():
+                    shell.sendcontrol("c")
+                else:
+                    shell = pexpect.spawn("/usr/bin/sh -c 'su base-user'",
+                                          encoding="utf-8")
+                continue
+            latencies.append(perf_counter() - start)
+    finally:
+        shell.close()
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("required", [False, True])
+def test_su_login_with_sc_load(local_user, benchmark, required):
+    """Run concurrent su logins of the local user with the smart card.
+
+    For every concurrency level, report login throughput, latency
+    percentiles, maximal number of concurrently running p11_child processes,
+    CPU time used by pcscd and its maximal resident memory.
+    """
+    levels = []
+    level = 1
+    while level < benchmark.concurrency:
+        levels.append(level)
+        level *= 2
+    levels.append(benchmark.concurrency)
+
+    total_failures = 0
+    with (Authselect(required=required),
+          local_user.card(insert=True) as sc):
+        for concurrency in levels:
+            logins = queue.Queue()
+            for i in range(benchmark.iterations):
+                logins.put(i)
+            latencies, failures = [], []
+            workers = [threading.Thread(target=_login_worker,
+                                        args=(local_user, sc, logins,
+                                              latencies, failures))
+                       for _ in range(concurrency)]
+
+            sampler = _ProcessSampler()
+            sampler.start()
+            start = perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            duration = perf_counter() - start
+            processes = sampler.stop()
+
+            benchmark.add(
+                "su_login_load",
+                {"user": local_user.username, "required": required,
+                 "concurrency": concurrency},
+                latencies, failures=len(failures), duration=duration,
+                **processes)
+            total_failures += len(failures)
+    assert total_failures == 0, f"{total_failures} logins failed"
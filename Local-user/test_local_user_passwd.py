@@ -1,13 +1,15 @@
 import pytest
 
 from SCAutolib.models.authselect import Authselect
-from SCAutolib.utils import isDistro
+
+pytestmark = pytest.mark.writes("authselect", "cards")
 
 
 @pytest.mark.parametrize(
     "required,lock_on_removal", [(True, True), (True, False), (False, True), (False, False),]
 )
-def test_change_local_user_passwd(local_user, user_shell, required, lock_on_removal):
+def test_change_local_user_passwd(local_user, user_shell, capabilities,
+                                  required, lock_on_removal):
     """Run 'passwd' command when smartcard login is enforced and after user is
     authenticated in with a smartcard.
 
@@ -46,7 +48,4 @@ def test_change_local_user_passwd(local_user, user_shell, required, lock_on_remo
             user_shell.sendline(cmd)
             user_shell.expect_exact(f"PIN for {local_user.username}:")
             user_shell.sendline(local_user.pin)
-            if isDistro(['rhel', 'centos'], '>=10') or isDistro('fedora', '>=40'):
-                user_shell.expect(r"[cC]urrent [pP]assword")
-            else:
-                user_shell.expect_exact(f"Changing password for user {local_user.username}.")
+            user_shell.expect(capabilities.passwd_prompt(local_user.username))
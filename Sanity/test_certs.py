@@ -7,6 +7,8 @@ from SCAutolib.models.authselect import Authselect
 from SCAutolib.models.file import File
 from SCAutolib.models.CA import BaseCA
 
+pytestmark = pytest.mark.writes("authselect", "sssd_auth_ca_db", "cards")
+
 
 @pytest.mark.parametrize("sssd_db", [File("/etc/sssd/pki/sssd_auth_ca_db.pem")])
 def test_wrong_issuer_cert(local_user, sssd_db, user_shell, tmp_path):
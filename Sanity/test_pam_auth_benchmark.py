@@ -0,0 +1,108 @@
+"""Benchmark of smart card authentication through PAM.
+
+Authentication is driven by 'sssctl user-checks -a auth' the same way as in
+test_pam_services_config and test_smart_card_gdm_login_enforcing. Tests in this
+module are executed only with --benchmark. Users are selected by
+--with-user-type, PAM services by --benchmark-pam-service, authselect features
+of the PAM stack by --benchmark-pam-stack and the number of iterations by
+--benchmark-iterations.
+
+Each iteration is split into two phases:
+    prompt - from running sssctl to the PIN prompt. Covers user lookup and
+             reading of the certificates from the card by p11_child.
+    auth   - from entering the PIN to the result of pam_authenticate.
+"""
+import re
+from time import perf_counter
+
+import pexpect
+import pytest
+
+from SCAutolib import run
+from SCAutolib.models.authselect import Authselect
+from conftest import check_multicert
+from prompts import PROMPTS
+
+pytestmark = pytest.mark.writes("authselect", "cards")
+
+# authselect features of the sssd profile: Authselect argument enabling it
+FEATURES = {
+    "with-smartcard": None,
+    "with-smartcard-required": "required",
+    "with-smartcard-lock-on-removal": "lock_on_removal",
+    "with-mkhomedir": "mk_homedir",
+    "with-sudo": "sudo",
+    "with-gssapi": "gssapi",
+}
+
+
+def _authselect(stack):
+    """Return Authselect configuring the sssd profile with features given
+    as comma-separated string."""
+    features = [f.strip() for f in stack.split(",") if f.strip()]
+    unknown = set(features) - set(FEATURES)
+    if unknown:
+        raise pytest.UsageError(
+            f"Unknown authselect features {', '.join(sorted(unknown))} in "
+            f"--benchmark-pam-stack, known are {', '.join(FEATURES)}")
+    return Authselect(**{FEATURES[f]: True for f in features if FEATURES[f]})
+
+
+def _authenticate(shell, user, sc, service):
+    """Run one authentication and return durations of both phases or None
+    if the authentication failed."""
+    start = perf_counter()
+    shell.sendline(f"sssctl user-checks -s {service} {user.username} -a auth")
+    check_multicert(shell=shell)
+    shell.expect(f"PIN for.*{re.escape(sc.label)}.*:")
+    prompt = perf_counter()
+    shell.sendline(sc.pin)
+    # a failed authentication is reported right away instead of timing out
+    event = PROMPTS.expect(shell, ["success", "failure"])
+    if event.name == "failure" or user.username not in event.text:
+        return None
+    return prompt - start, perf_counter() - prompt
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("cache", ["warm", "cold"])
+def test_pam_auth_benchmark(user, root_shell, benchmark, pam_service,
+                            pam_stack, cache):
+    """Measure latency of smart card authentication of the user to the PAM
+    service.
+
+    With warm cache, SSSD is restarted once and one authentication is made
+    before the measurement. With cold cache, all SSSD cache entries are
+    invalidated and SSSD is restarted before every iteration.
+    """
+    phases = {"prompt": [], "auth": []}
+    failures = 0
+    with _authselect(pam_stack), user.card(insert=True) as sc:
+        run("systemctl restart sssd".split(), sleep=5)
+        if cache == "warm":
+            _authenticate(root_shell, user, sc, pam_service)
+
+        for _ in range(benchmark.iterations):
+            if cache == "cold":
+                run(["sss_cache", "-E"])
+                run("systemctl restart sssd".split(), sleep=5)
+            try:
+                result = _authenticate(root_shell, user, sc, pam_service)
+            except (pexpect.TIMEOUT, pexpect.EOF):
+                result = None
+                root_shell.sendcontrol("c")
+            if result is None:
+                failures += 1
+                continue
+            prompt, auth = result
+            phases["prompt"].append(prompt)
+            phases["auth"].append(auth)
+
+    for phase, latencies in phases.items():
+        benchmark.add(
+            "pam_auth",
+            {"user": user.username, "service": pam_service,
+             "stack": pam_stack, "cache": cache, "phase": phase},
+            latencies, failures=failures)
+    assert failures == 0, f"{failures} of {benchmark.iterations} " \
+                          "authentications failed"
@@ -0,0 +1,69 @@
+"""Recording and replay of shells (recording.py).
+
+The shells run a stand-in for 'su' with a smart card: it asks for the PIN of
+the card and prints the result of pam_authenticate like sssctl user-checks.
+The tests don't touch the host, so they run on any machine, e.g. with the
+recorded session in Sanity/recordings:
+
+    pytest --replay-dir Sanity/recordings Sanity/test_recording.py
+"""
+import shlex
+
+import pexpect
+import pytest
+
+import recording
+from conftest import enter_pin
+from prompts import PROMPTS
+from recording import Recording, ReplayCard, ReplayError, ReplaySpawn
+
+pytestmark = pytest.mark.reads()
+
+
+def _fake_su(username, sc):
+    """Return command of the stand-in for 'su' with the smart card."""
+    script = (f'printf "PIN for {sc.label}: "; read pin; '
+              f'if [ "$pin" = "{sc.pin}" ]; then '
+              f'echo "pam_authenticate for user [{username}]: Success"; '
+              'else echo "Login incorrect"; fi')
+    return f"/usr/bin/sh -c {shlex.quote(script)}"
+
+
+def _login(shell, sc):
+    """Enter the PIN and return the name of the result event."""
+    enter_pin(shell, sc)
+    event = PROMPTS.expect(shell, ["success", "failure"])
+    shell.expect(pexpect.EOF)
+    return event.name
+
+
+def test_record_and_replay(tmp_path):
+    """Shell recorded with Recording is replayed by ReplaySpawn with the same
+    result, input different from the recorded one is rejected."""
+    sc = ReplayCard("sc-test-card", "123456", label="sc-test-card")
+    cmd = _fake_su("sc-test-user", sc)
+    path = tmp_path.joinpath("su.jsonl")
+
+    rec = Recording(path, cmd)
+    shell = pexpect.spawn(cmd, encoding="utf-8", timeout=10)
+    rec.attach(shell)
+    assert _login(shell, sc) == "success"
+    rec.close()
+
+    replay = ReplaySpawn(path, timeout=10)
+    assert replay.command == cmd
+    assert _login(replay, sc) == "success"
+
+    replay = ReplaySpawn(path, timeout=10)
+    PROMPTS.expect(replay, ["pin"])
+    with pytest.raises(ReplayError):
+        replay.sendline("000000")
+
+
+def test_su_login_with_sc_replay(local_user):
+    """Login of the local user through recording.spawn. With --replay-dir
+    Sanity/recordings, the shell and the user come from the recorded
+    session."""
+    shell = recording.spawn(_fake_su(local_user.username, local_user.card),
+                            encoding="utf-8", timeout=10)
+    assert _login(shell, local_user.card) == "success"
@@ -1,5 +1,18 @@
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+
 import pytest
 
+pytestmark = pytest.mark.writes("cards")
+
+DETECTION_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+# SSSD runs p11_child with --pre to find the card and certificates on it
+P11_CHILD_PRE = ["/usr/libexec/sssd/p11_child", "--pre",
+                 "--nssdb=/etc/sssd/pki/sssd_auth_ca_db.pem"]
+
+
 def test_modutil_token_info(local_user, root_shell):
     """Check that p11-kit module shows smart card information with modutil
     command"""
@@ -10,6 +23,7 @@ def test_modutil_token_info(local_user, root_shell):
         root_shell.sendline(cmd)
         root_shell.expect_exact(uri)
 
+@pytest.mark.writes("pam_cert_service")
 @pytest.mark.parametrize("service,should_pass", [
     ("-su", False),
     ("+pam_cert_service", True)
@@ -51,3 +65,62 @@ def test_physical_card_detection(local_user, root_shell):
             sc.insert()
             root_shell.sendline(cmd)
             root_shell.expect_exact(sc.label)
+
+
+def _wait_for_token(cmd, label, present, start, timeout=DETECTION_TIMEOUT):
+    """Run cmd until label is (or isn't) in its output. Return time since
+    start when it happened or None if it didn't happen within timeout."""
+    while perf_counter() - start < timeout:
+        out = subprocess.run(cmd, capture_output=True, encoding="utf-8")
+        if (label in out.stdout) == present:
+            return perf_counter() - start
+        sleep(POLL_INTERVAL)
+    return None
+
+
+@pytest.mark.benchmark
+@pytest.mark.reads("sssd_auth_ca_db")
+def test_card_insert_remove_soak(local_user, benchmark):
+    """Insert and remove each loaded card --benchmark-iterations times.
+
+    Measure the time from the start of insertion until the token is listed
+    by 'pkcs11-tool -L' and found by SSSD's p11_child (the same way SSSD
+    looks for certificates on the card), and the same for the removal.
+    Both probes poll at the same time from the start of the transition, so
+    neither waits for the other one nor for the pause VirtualCard makes after
+    starting or stopping its service. Transitions that are not detected
+    within DETECTION_TIMEOUT are counted as missed.
+    """
+    probes = {"pkcs11": ["pkcs11-tool", "-L"], "sssd": P11_CHILD_PRE}
+    missed_total = 0
+    for i in range(local_user.total_cards):
+        with getattr(local_user, f"card_{i}") as sc:
+            latencies = {(t, p): [] for t in ("insert", "remove")
+                         for p in probes}
+            missed = dict.fromkeys(latencies, 0)
+            for _ in range(benchmark.iterations):
+                for transition, action in (("insert", sc.insert),
+                                           ("remove", sc.remove)):
+                    with ThreadPoolExecutor(len(probes)) as pool:
+                        start = perf_counter()
+                        waits = {probe: pool.submit(
+                                     _wait_for_token, cmd, sc.label,
+                                     transition == "insert", start)
+                                 for probe, cmd in probes.items()}
+                        action()
+                        for probe, wait in waits.items():
+                            latency = wait.result()
+                            if latency is None:
+                                missed[(transition, probe)] += 1
+                            else:
+                                latencies[(transition, probe)].append(
+                                    latency)
+
+            for (transition, probe), values in latencies.items():
+                benchmark.add(
+                    "card_detection",
+                    {"card": f"card_{i}", "transition": transition,
+                     "probe": probe},
+                    values, failures=missed[(transition, probe)])
+            missed_total += sum(missed.values())
+    assert missed_total == 0, f"{missed_total} transitions were not detected"
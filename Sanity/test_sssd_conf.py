@@ -1,19 +1,20 @@
 # author: Pavel Yadlouski <pyadlous@redhat.com>
 
 import pytest
-import sys
 from time import sleep
 import pexpect
 from SCAutolib.models.authselect import Authselect
 from SCAutolib.utils import run
 from conftest import log, local_user as local_user_conftest
+import recording
+
+pytestmark = pytest.mark.writes("authselect", "cards")
 
 
 def login_shell_factory(username):
     """Returns login shell for username."""
-    shell = pexpect.spawn(f"login {username}",
-                          ignore_sighup=True, encoding="utf-8")
-    shell.logfile = sys.stdout
+    shell = recording.spawn(f"login {username}",
+                            ignore_sighup=True, encoding="utf-8")
     sleep(3)
     return shell
 
@@ -8,7 +8,6 @@ that TTY. Therefore, execution of login command in nearly the same way agetty
 does it is good approximation to manual testing in virtual console.
 """
 import re
-import sys
 from time import sleep
 from conftest import check_multicert
 
@@ -16,14 +15,15 @@ import pexpect
 import pytest
 
 from SCAutolib.models.authselect import Authselect
-from SCAutolib.utils import isDistro
+import recording
+
+pytestmark = pytest.mark.writes("authselect", "cards")
 
 
 def login_shell_factory(username):
     """Returns login shell for username."""
-    shell = pexpect.spawn(f"login {username}",
-                          ignore_sighup=True, encoding="utf-8")
-    shell.logfile = sys.stdout
+    shell = recording.spawn(f"login {username}",
+                            ignore_sighup=True, encoding="utf-8")
     sleep(3)
     return shell
 
@@ -266,7 +266,7 @@ def test_login_sc_required(user, lock_on_removal):
 @pytest.mark.parametrize(
         "required,lock_on_removal", [(True, True), (True, False), (False, True), (False, False),]
     )
-def test_login_local_user_passwd(user, required, lock_on_removal):
+def test_login_local_user_passwd(user, capabilities, required, lock_on_removal):
     """Run 'passwd' command when smartcard login is enforced and after user is
     authenticated in with a smartcard.
 
@@ -307,10 +307,7 @@ def test_login_local_user_passwd(user, required, lock_on_removal):
             login_shell.sendline(user.pin)
             login_shell.expect([user.username])
             login_shell.sendline("passwd")
-            if isDistro(['rhel', 'centos'], '>=10') or isDistro('fedora', '>=40'):
-                login_shell.expect_exact(f"Current password")
-            else:
-                login_shell.expect_exact(f"Changing password for user {user.username}.")
+            login_shell.expect(capabilities.passwd_prompt(user.username))
 
 @pytest.mark.parametrize(
     "required,lock_on_removal", [(True, True), (True, False), (False, True), (False, False),]
@@ -0,0 +1,104 @@
+"""Collecting and reporting results of benchmark tests.
+
+Benchmark tests are marked with ``@pytest.mark.benchmark`` and are skipped
+unless pytest is executed with ``--benchmark``. They get the session-scoped
+``benchmark`` fixture (BenchmarkReport) and add their measurements to it. At
+the end of the session the report is written in JSON format to the file given
+by ``--benchmark-json``.
+"""
+import json
+import logging
+import math
+import platform
+from datetime import datetime, timezone
+
+log = logging.getLogger("PyTest")
+
+
+def percentile(values, q):
+    """
+    Return q-th percentile of values using the nearest-rank method.
+
+    :param values: list of numbers
+    :param q: percentile between 0 and 100
+    :return: the percentile or None if values is empty
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies, failures=0, duration=None):
+    """
+    Summarize latencies (in seconds) of successful iterations.
+
+    :param latencies: list of latencies of successful iterations
+    :param failures: number of failed iterations
+    :param duration: wall time of all iterations in seconds, used to compute
+                     throughput
+    :return: dictionary with the summary
+    """
+    summary = {
+        "count": len(latencies),
+        "failures": failures,
+        "min": min(latencies) if latencies else None,
+        "max": max(latencies) if latencies else None,
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+    if duration:
+        summary["duration"] = duration
+        summary["throughput"] = len(latencies) / duration
+    return summary
+
+
+class BenchmarkReport:
+    """Results of all benchmarks executed in the session."""
+
+    def __init__(self, iterations, concurrency):
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.results = []
+
+    def add(self, name, params, latencies, failures=0, duration=None,
+            samples=True, **extra):
+        """
+        Add a result of one benchmark scenario.
+
+        :param name: name of the benchmark
+        :param params: dictionary of parameters identifying the scenario
+        :param latencies: list of latencies of successful iterations in
+                          seconds
+        :param failures: number of failed iterations
+        :param duration: wall time of all iterations in seconds
+        :param samples: include the individual latencies in the report
+        :param extra: additional values to be stored with the result
+        :return: summary of the result
+        """
+        summary = summarize(latencies, failures, duration)
+        result = {"name": name, "params": params, "summary": summary, **extra}
+        if samples:
+            result["latencies"] = latencies
+        self.results.append(result)
+        log.info("Benchmark %s %s: %s", name, params,
+                 ", ".join(f"{k}={v:.4f}" if isinstance(v, float) else
+                           f"{k}={v}" for k, v in summary.items()))
+        return summary
+
+    def to_dict(self):
+        return {
+            "host": platform.node(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "iterations": self.iterations,
+            "concurrency": self.concurrency,
+            "results": self.results,
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        log.info("Benchmark results are written to %s", path)
@@ -0,0 +1,67 @@
+"""Capabilities of the platform the tests are executed on.
+
+The platform is probed once per session (``capabilities`` fixture) and tests
+use its attributes instead of checking distribution versions themselves:
+
+    user_shell.sendline("passwd")
+    user_shell.expect(capabilities.passwd_prompt(user.username))
+"""
+import logging
+import re
+import subprocess
+from dataclasses import dataclass
+from typing import Optional
+
+import distro
+
+from timing_db import package_version
+
+log = logging.getLogger("PyTest")
+
+
+def _owner(path):
+    """Return name of the RPM package owning the file or None."""
+    try:
+        out = subprocess.run(["rpm", "-qf", "--qf", "%{NAME}", path],
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+@dataclass(frozen=True)
+class Capabilities:
+    """Versions of the platform components and behaviour derived from them."""
+
+    distro: Optional[str]
+    distro_version: Optional[str]
+    sssd: Optional[str]
+    gdm: Optional[str]
+    # package providing /usr/bin/passwd: 'passwd' or, since RHEL/CentOS 10
+    # and Fedora 40, 'shadow-utils'
+    passwd_package: Optional[str]
+
+    @property
+    def shadow_passwd(self):
+        """passwd from shadow-utils asks for the current password right away
+        instead of printing "Changing password for user ..." first."""
+        return self.passwd_package == "shadow-utils"
+
+    @classmethod
+    def probe(cls):
+        """Detect capabilities of this host."""
+        caps = cls(
+            distro=distro.id() or None,
+            distro_version=distro.version() or None,
+            sssd=package_version("sssd"),
+            gdm=package_version("gdm"),
+            passwd_package=_owner("/usr/bin/passwd"),
+        )
+        log.debug("Platform capabilities: %s", caps)
+        return caps
+
+    def passwd_prompt(self, username):
+        """Return the first prompt of passwd run by the user."""
+        if self.shadow_passwd:
+            return re.compile(r"[cC]urrent [pP]assword")
+        return re.compile(re.escape(f"Changing password for user {username}."))
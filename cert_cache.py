@@ -0,0 +1,111 @@
+"""Cache of certificates issued by the IPA server for test fixtures.
+
+Issuing a certificate requires a new private key, a CSR and a round trip to the
+IPA server. Fixtures that only need *some* valid certificate for a given
+subject (e.g. the certificate of the local HTTPS server) can reuse a
+certificate issued in one of the previous runs instead.
+"""
+import hashlib
+import json
+import logging
+import shutil
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from cryptography import x509
+from cryptography.hazmat.primitives.hashes import SHA256
+
+log = logging.getLogger("PyTest")
+
+DEFAULT_PROFILE = "caIPAserviceCert"
+
+
+def _not_valid_after(cert):
+    # not_valid_after_utc is not available in older versions of cryptography
+    if hasattr(cert, "not_valid_after_utc"):
+        return cert.not_valid_after_utc
+    return cert.not_valid_after.replace(tzinfo=timezone.utc)
+
+
+class CertCache:
+    """
+    Certificate/key pairs issued by the IPA server, stored on disk.
+
+    Entries are keyed on the certificate subject, the fingerprint of the IPA CA
+    certificate and the certificate profile, so a change of the IPA server or
+    the profile never reuses an old certificate. An entry is reused only if
+    the certificate is valid for at least ``min_validity`` and the IPA server
+    doesn't report it as revoked.
+    """
+
+    def __init__(self, directory, ipa_server, ca_cert=Path("/etc/ipa/ca.crt"),
+                 min_validity=timedelta(days=1)):
+        self.directory = Path(directory)
+        self._ipa_server = ipa_server
+        ca = x509.load_pem_x509_certificate(Path(ca_cert).read_bytes())
+        self.ca_fingerprint = ca.fingerprint(SHA256()).hex()
+        self.min_validity = min_validity
+
+    def _entry_dir(self, subject, profile):
+        key = json.dumps([subject, self.ca_fingerprint, profile])
+        return self.directory.joinpath(hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, subject, profile=DEFAULT_PROFILE):
+        """
+        Look up a cached certificate.
+
+        :param subject: subject of the certificate in RFC 4514 format,
+                        e.g. ``CN=https-server``
+        :param profile: IPA certificate profile the certificate was issued
+                        with
+        :return: tuple of paths to the certificate and private key or None if
+                 there is no usable certificate in the cache
+        """
+        entry = self._entry_dir(subject, profile)
+        cert_path = entry.joinpath("cert.pem")
+        key_path = entry.joinpath("key.pem")
+        if not (cert_path.exists() and key_path.exists()):
+            log.debug("No cached certificate for %s", subject)
+            return None
+
+        cert = x509.load_pem_x509_certificate(cert_path.read_bytes())
+        now = datetime.now(timezone.utc)
+        if _not_valid_after(cert) - now < self.min_validity:
+            log.debug("Cached certificate for %s expires soon", subject)
+            shutil.rmtree(entry)
+            return None
+
+        r = self._ipa_server.meta_client.cert_show(str(cert.serial_number))
+        if r["result"].get("revoked"):
+            log.debug("Cached certificate for %s is revoked", subject)
+            shutil.rmtree(entry)
+            return None
+
+        log.debug("Using cached certificate %s for %s", cert.serial_number,
+                  subject)
+        return cert_path, key_path
+
+    def put(self, subject, cert, key, profile=DEFAULT_PROFILE):
+        """
+        Store an issued certificate and its private key in the cache.
+
+        :param subject: subject of the certificate in RFC 4514 format
+        :param cert: base64 encoded certificate as returned by IPA
+        :param key: path to the private key in PEM format
+        :param profile: IPA certificate profile the certificate was issued
+                        with
+        :return: tuple of paths to the cached certificate and private key
+        """
+        entry = self._entry_dir(subject, profile)
+        entry.mkdir(mode=0o700, parents=True, exist_ok=True)
+        cert_path = entry.joinpath("cert.pem")
+        key_path = entry.joinpath("key.pem")
+
+        key_path.touch(mode=0o600)
+        key_path.chmod(0o600)
+        key_path.write_bytes(Path(key).read_bytes())
+        cert_path.write_text("-----BEGIN CERTIFICATE-----\n"
+                             f"{cert}\n"
+                             "-----END CERTIFICATE-----")
+        log.debug("Certificate for %s is stored in %s", subject, entry)
+        return cert_path, key_path
@@ -1,10 +1,29 @@
 import logging
+import shutil
+import tempfile
+
+import pytest
 
 from SCAutolib.models.CA import BaseCA, IPAServerCA
+from SCAutolib.models.authselect import Authselect
 from SCAutolib.models.card import Card
 from SCAutolib.models.user import User
 
 from fixtures import *
+from etc_snapshot import EtcSnapshot
+from impact import ImpactSelector
+from ipa_client import IPASession
+from key_pool import KeyPool
+from matrix import reduce_matrix
+from phase_timing import PhaseTimer
+from profiling import Profiler
+from prompts import PROMPTS
+from recording import ShellRecorder, install as install_recorder, \
+    user as load_user
+from resources import ResourceLocks
+from scheduling import Scheduler
+from timing_db import TimingDB, TimingRecorder
+from transcript import TranscriptCapture
 
 log = logging.getLogger("PyTest")
 log.setLevel(logging.DEBUG)
@@ -41,6 +60,63 @@ def check_multicert(shell = None, gui = None):
     return False
 
 
+def enter_pin(shell, sc):
+    """Handle smart card prompts of su/login in shell and enter the PIN."""
+    while True:
+        event = PROMPTS.expect(shell, ["cert_select", "pin"])
+        if event.name == "cert_select":
+            assert multicert, "Card has multiple certificates, use " \
+                              "--select-cert"
+            shell.sendline(multicert)
+        elif sc.label in event.text:
+            break
+    shell.sendline(sc.pin)
+
+
+def load_ipa_user(config):
+    """Load the IPA server client and the IPA user with their tokens."""
+    global ipa_server
+    log.debug("Loading IPA client")
+    ipa_server = IPAServerCA.factory()
+    # All IPA calls in the session share one pooled, authenticated
+    # connection. It has to be set before any IPA user is created as
+    # users keep reference to the client.
+    ipa_server.meta_client = IPASession.from_server(
+        ipa_server, config.getoption("ipa_host"),
+        config.getoption("ipa_ca_cert") or False)
+    log.debug("IPA client is loaded")
+    log.debug("Loading IPA user")
+    ipa_user = User.load(
+        username = config.getoption("ipa_username"),
+        ipa_server=ipa_server)
+    assert ipa_user.user_type == "ipa"
+    log.debug("IPA user is loaded")
+    load_tokens(ipa_user, tokens, config.getoption("update_sssd"))
+    ipa_user.card = ipa_user.card_0
+    ipa_user.pin = ipa_user.card.pin
+    return ipa_user
+
+
+def load_local_user(config):
+    """Load the local user with their tokens."""
+    log.debug("Loading local user")
+    local_user = User.load(username = config.getoption("local_username"))
+    assert local_user.user_type == "local"
+    log.debug("Local user is loaded")
+    load_tokens(local_user, tokens, config.getoption("update_sssd"))
+    # backwards compatibility fix. Older tests expected one virtual card
+    # as attribute of user - i.e. user.card and approached card this way.
+    # As of now we expect user can have multiple cards, they are marked
+    # user.card_0, user.card_1, ... however, for backwards compatibility,
+    # we need to provide user.card:
+    local_user.card = local_user.card_0
+
+    # pin used to be user attribute. as we can currently have multiple cards
+    # pin was moved to card. For backwards compatibility:
+    local_user.pin = local_user.card.pin
+    return local_user
+
+
 def pytest_configure(config):
     global ipa_user
     global ipa_server
@@ -56,35 +132,112 @@ def pytest_configure(config):
     if not tokens:
         tokens = ["virt-card-1"]
 
+    profiler = None
+    profile_dir = config.getoption("profile_dir")
+    if profile_dir:
+        profiler = Profiler(profile_dir, config.getoption("profile_select"))
+        config.pluginmanager.register(profiler, "profiling")
+        profiler.start("pytest_configure")
+
+    json_path = config.getoption("phase_timing_json")
+    openmetrics_path = config.getoption("phase_timing_openmetrics")
+    timing_db = config.getoption("timing_db")
+    if json_path or openmetrics_path or timing_db:
+        timer = PhaseTimer(json_path, openmetrics_path)
+        timer.install()
+        config.pluginmanager.register(timer, "phase_timing")
+        if timing_db:
+            config.pluginmanager.register(TimingRecorder(timing_db, timer),
+                                          "timing_db")
+
+    shard = config.getoption("shard")
+    budget = config.getoption("time_budget")
+    longest_first = config.getoption("schedule_longest_first")
+    if shard or budget is not None or longest_first:
+        try:
+            index, count = (int(n) for n in shard.split("/")) if shard \
+                else (1, 1)
+        except ValueError:
+            raise pytest.UsageError(f"--shard should be K/N, not {shard}")
+        if not 1 <= index <= count:
+            raise pytest.UsageError(f"Shard {index} of {count} doesn't exist")
+        durations, outcomes = {}, {}
+        if timing_db:
+            db = TimingDB(timing_db)
+            durations, outcomes = db.durations(), db.outcomes()
+            db.close()
+        config.pluginmanager.register(
+            Scheduler(durations, outcomes, (index, count) if shard else None,
+                      longest_first, budget), "scheduler")
+
+    transcript_tail = config.getoption("transcript_tail")
+    if transcript_tail <= 0:
+        raise pytest.UsageError("--transcript-tail should be positive, not "
+                                f"{transcript_tail}")
+    # transcripts are kept in the pytest cache unless a directory is given,
+    # without both, shells log to stdout
+    transcript_dir = config.getoption("transcript_dir")
+    if transcript_dir is None and getattr(config, "cache", None) is not None:
+        transcript_dir = config.cache.mkdir("transcripts")
+    if transcript_dir is not None:
+        config.pluginmanager.register(
+            TranscriptCapture(transcript_dir, transcript_tail), "transcript")
+
+    record_dir = config.getoption("record_dir")
+    replay_dir = config.getoption("replay_dir")
+    if record_dir or replay_dir:
+        recorder = ShellRecorder(record_dir, replay_dir)
+        install_recorder(recorder)
+        config.pluginmanager.register(recorder, "shell_recorder")
+
+    locks = ResourceLocks(config.getoption("resource_lock_dir"))
+    config.pluginmanager.register(locks, "resource_locks")
+
+    # users and cards are loaded on the host or, when replaying, created from
+    # the recorded session
     if user_type in ["ipa", "all"]:
-        log.debug("Loading IPA client")
-        ipa_server = IPAServerCA.factory()
-        log.debug("IPA client is loaded")
-        log.debug("Loading IPA user")
-        ipa_user = User.load(
-            username = config.getoption("ipa_username"),
-            ipa_server=ipa_server)
-        assert ipa_user.user_type == "ipa"
-        log.debug("IPA user is loaded")
-        load_tokens(ipa_user, tokens, config.getoption("update_sssd"))
-        ipa_user.card = ipa_user.card_0
-        ipa_user.pin = ipa_user.card.pin
+        ipa_user = load_user("ipa_user", lambda: load_ipa_user(config))
     if user_type in ["local", "all"]:
-        log.debug("Loading local user")
-        local_user = User.load(username = config.getoption("local_username"))
-        assert local_user.user_type == "local"
-        log.debug("Local user is loaded")
-        load_tokens(local_user, tokens, config.getoption("update_sssd"))
-        # backwards compatibility fix. Older tests expected one virtual card
-        # as attribute of user - i.e. user.card and approached card this way.
-        # As of now we expect user can have multiple cards, they are marked
-        # user.card_0, user.card_1, ... however, for backwards compatibility,
-        # we need to provide user.card:
-        local_user.card = local_user.card_0
-
-        # pin used to be user attribute. as we can currently have multiple cards
-        # pin was moved to card. For backwards compatibility:
-        local_user.pin = local_user.card.pin
+        local_user = load_user("local_user", lambda: load_local_user(config))
+    if replay_dir:
+        # host configuration isn't changed when shells are replayed
+        patch = pytest.MonkeyPatch()
+        patch.setattr(Authselect, "_set", lambda self: None)
+        patch.setattr(Authselect, "_restore", lambda self: None)
+        config.add_cleanup(patch.undo)
+
+    if config.getoption("impact_select"):
+        cards = [getattr(user, f"card_{i}")
+                 for user in (local_user, ipa_user) if user is not None
+                 for i in range(user.total_cards)]
+        config.pluginmanager.register(
+            ImpactSelector(config.cache, cards, config.rootpath),
+            "impact_select")
+
+    etc_restore = config.getoption("etc_restore")
+    if etc_restore:
+        # taken after the cards updated sssd.conf. Registered after
+        # ResourceLocks, so its hook wraps the locks of the test and restores
+        # after they are released.
+        snapshot = EtcSnapshot(etc_restore, locks=locks)
+        snapshot.take()
+        config.pluginmanager.register(snapshot, "etc_snapshot")
+
+    if profiler is not None:
+        profiler.stop()
+
+
+def pytest_unconfigure(config):
+    timer = config.pluginmanager.get_plugin("phase_timing")
+    if timer is not None:
+        timer.uninstall()
+    snapshot = config.pluginmanager.get_plugin("etc_snapshot")
+    if snapshot is not None:
+        snapshot.remove()
+    # meta_client is SCAutolib's own client if IPASession failed to connect
+    if ipa_server is not None \
+            and isinstance(ipa_server.meta_client, IPASession):
+        ipa_server.meta_client.close()
 
 
 def pytest_addoption(parser):
@@ -98,6 +251,23 @@ def pytest_addoption(parser):
         help="Username of IPA user to be used in tests",
         dest="ipa_username"
     )
+    parser.addoption(
+        "--ipa-host",
+        action="store",
+        default=None,
+        help="Host[:port] of IPA JSON-RPC API to be used instead of the IPA "
+             "server hostname, e.g. local stand-in server",
+        dest="ipa_host"
+    )
+    parser.addoption(
+        "--ipa-ca-cert",
+        action="store",
+        default=None,
+        dest="ipa_ca_cert",
+        help="CA certificate to verify the TLS certificate of the IPA "
+             "JSON-RPC API with, e.g. /etc/ipa/ca.crt or CA of a local "
+             "stand-in server. The certificate is not verified by default"
+    )
     parser.addoption(
         "--local-username",
         action="store",
@@ -136,6 +306,244 @@ def pytest_addoption(parser):
              "Provide which cert to use. "
              "Note that this selection will apply to all tokens!"
     )
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        dest="benchmark",
+        help="Run benchmark tests (marked with 'benchmark')"
+    )
+    parser.addoption(
+        "--benchmark-iterations",
+        action="store",
+        type=int,
+        default=100,
+        dest="benchmark_iterations",
+        help="Number of iterations of each benchmark scenario"
+    )
+    parser.addoption(
+        "--benchmark-concurrency",
+        action="store",
+        type=int,
+        default=10,
+        dest="benchmark_concurrency",
+        help="Number of concurrent clients in concurrent benchmark scenarios"
+    )
+    parser.addoption(
+        "--benchmark-json",
+        action="store",
+        default="benchmark.json",
+        dest="benchmark_json",
+        help="File to write results of benchmark tests to"
+    )
+    parser.addoption(
+        "--benchmark-pam-service",
+        action="append",
+        default=[],
+        dest="pam_services",
+        help="PAM service to be used in PAM authentication benchmarks. "
+             "Can be used multiple times, default is gdm-smartcard"
+    )
+    parser.addoption(
+        "--benchmark-pam-stack",
+        action="append",
+        default=[],
+        dest="pam_stacks",
+        help="Comma-separated authselect features of the sssd profile to "
+             "be used in PAM authentication benchmarks in addition to "
+             "with-smartcard, e.g. with-smartcard-required,with-mkhomedir. "
+             "Use 'with-smartcard' alone for no additional features. Can "
+             "be used multiple times, default is with-smartcard and "
+             "with-smartcard-required"
+    )
+    parser.addoption(
+        "--phase-timing-json",
+        action="store",
+        default=None,
+        dest="phase_timing_json",
+        help="Write durations of phases of each test (setup, authselect, "
+             "card insert/remove, SSSD restart, authentication wait, "
+             "teardown) to this JSON file"
+    )
+    parser.addoption(
+        "--phase-timing-openmetrics",
+        action="store",
+        default=None,
+        dest="phase_timing_openmetrics",
+        help="Write durations of phases of each test to this file in "
+             "OpenMetrics text format, e.g. for node exporter textfile "
+             "collector"
+    )
+    parser.addoption(
+        "--timing-db",
+        action="store",
+        default=None,
+        dest="timing_db",
+        help="Store durations of phases of each test in this SQLite database "
+             "and warn about slowdowns against previous runs. See "
+             "'python timing_db.py report --help'"
+    )
+    parser.addoption(
+        "--matrix-strength",
+        action="store",
+        type=int,
+        default=None,
+        dest="matrix_strength",
+        help="Run only variants of parametrized tests covering all "
+             "combinations of values of this many parameters (2 for "
+             "pairwise), instead of the full product"
+    )
+    parser.addoption(
+        "--shard",
+        action="store",
+        default=None,
+        dest="shard",
+        help="Run only K-th of N shards of tests balanced on durations from "
+             "--timing-db, given as K/N"
+    )
+    parser.addoption(
+        "--schedule-longest-first",
+        action="store_true",
+        default=False,
+        dest="schedule_longest_first",
+        help="Run test modules ordered by their durations from --timing-db, "
+             "the longest first"
+    )
+    parser.addoption(
+        "--time-budget",
+        action="store",
+        type=float,
+        default=None,
+        dest="time_budget",
+        help="Run only the most valuable tests (failed last time, new, "
+             "others) fitting into this number of seconds according to "
+             "durations from --timing-db"
+    )
+    parser.addoption(
+        "--impact-select",
+        action="store_true",
+        default=False,
+        dest="impact_select",
+        help="Skip tests that passed with the same sssd.conf, authselect "
+             "profile, package versions, card certificates and test code"
+    )
+    parser.addoption(
+        "--etc-restore",
+        action="store",
+        default=None,
+        dest="etc_restore",
+        choices=["test", "module"],
+        help="Snapshot sssd, pam.d, authselect, pki and hosts configuration "
+             "at the start and restore it after each test or module"
+    )
+    parser.addoption(
+        "--transcript-dir",
+        action="store",
+        default=None,
+        dest="transcript_dir",
+        help="Directory for compressed transcripts of shells, one per test. "
+             "Default is the transcripts directory of the pytest cache "
+             "(.pytest_cache/d/transcripts)"
+    )
+    parser.addoption(
+        "--transcript-tail",
+        action="store",
+        type=int,
+        default=64 * 1024,
+        dest="transcript_tail",
+        help="Number of last characters of the transcript kept in memory "
+             "and attached to reports of failed tests"
+    )
+    parser.addoption(
+        "--record-dir",
+        action="store",
+        default=None,
+        dest="record_dir",
+        help="Record timestamped input and output of shells of each test "
+             "and the users and cards of the session to this directory "
+             "(recordings contain PINs and passwords)"
+    )
+    parser.addoption(
+        "--replay-dir",
+        action="store",
+        default=None,
+        dest="replay_dir",
+        help="Replay shells, users and cards of each test from recordings "
+             "in this directory, without a provisioned host (see "
+             "recording.py)"
+    )
+    parser.addoption(
+        "--resource-lock-dir",
+        action="store",
+        default="/run/lock/sc-tests",
+        dest="resource_lock_dir",
+        help="Directory with lock files of host resources shared by tests "
+             "(see resources.py). Pytest processes using the same "
+             "directory run only non-conflicting tests at the same time"
+    )
+    parser.addoption(
+        "--key-pool-size",
+        action="store",
+        type=int,
+        default=2,
+        dest="key_pool_size",
+        help="Number of private keys to keep pre-generated for fixtures. "
+             "Use 0 to generate keys on demand"
+    )
+    parser.addoption(
+        "--profile-dir",
+        action="store",
+        default=None,
+        dest="profile_dir",
+        help="Profile harness code (pytest_configure, fixtures, tests, "
+             "SCAutolib calls) and save profiles to this directory"
+    )
+    parser.addoption(
+        "--profile-select",
+        action="append",
+        default=[],
+        dest="profile_select",
+        help="Profile only tests with node ID matching this shell-style "
+             "pattern. Can be used multiple times, default is all tests"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    strength = config.getoption("matrix_strength")
+    if strength:
+        items[:], deselected = reduce_matrix(items, strength)
+        log.info("Matrix strength %s deselected %s of %s variants", strength,
+                 len(deselected), len(items) + len(deselected))
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+    if config.getoption("benchmark"):
+        return
+    skip = pytest.mark.skip(reason="Benchmarks are enabled by --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def key_pool(request):
+    """Pool of pre-generated private keys.
+
+    The pool is started by the first test using it, so runs without such
+    tests don't generate keys. Keys left from previous sessions are kept in
+    the pytest cache; without the cache provider (-p no:cacheprovider) they
+    are kept for this session only.
+    """
+    cache = getattr(request.config, "cache", None)
+    if cache is not None:
+        key_dir = cache.mkdir("key-pool")
+    else:
+        key_dir = tempfile.mkdtemp(prefix="key-pool-")
+    pool = KeyPool(key_dir, request.config.getoption("key_pool_size"))
+    pool.start()
+    yield pool
+    pool.stop()
+    if cache is None:
+        shutil.rmtree(key_dir, ignore_errors=True)
 
 
 def pytest_generate_tests(metafunc):
@@ -178,3 +586,11 @@ def pytest_generate_tests(metafunc):
         metafunc.parametrize("tokens", [tokens])
     if "check_multicert" in metafunc.fixturenames:
         metafunc.parametrize("check_multicert", [check_multicert])
+    if "pam_service" in metafunc.fixturenames:
+        # list option can't have non-empty default, see tokens
+        services = metafunc.config.getoption("pam_services")
+        metafunc.parametrize("pam_service", services or ["gdm-smartcard"])
+    if "pam_stack" in metafunc.fixturenames:
+        stacks = metafunc.config.getoption("pam_stacks")
+        metafunc.parametrize("pam_stack", stacks or [
+            "with-smartcard", "with-smartcard-required"])
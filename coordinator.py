@@ -0,0 +1,202 @@
+"""Run the suite sharded across several worker hosts.
+
+Every worker is a fully provisioned host (VM or container reachable by the
+remote shell command) with a checkout of the suite, its own local and IPA user
+and its own cards, i.e. a host the suite can run on by itself. Tests are
+collected on the first worker, split into one shard per worker and each shard
+is executed by a separate pytest process on its worker:
+
+    python coordinator.py --worker vm1 --worker vm2 --timing-db timings.db \\
+        --junitxml report.xml -- --with-user-type all
+
+Tokens (cards) are provisioned on each worker. When workers have different
+cards, --tokens HOST=TOKEN[,TOKEN...] allocates them: the worker runs with
+--with-tokens for each of its tokens, and each token can be allocated to one
+worker only.
+
+Shards are balanced on historical test durations from the timing database
+(see scheduling.py). JUnit XML reports of workers are merged into one report
+and phase timings of each worker are stored in the timing database tagged with
+the worker host, so the next run is balanced on up-to-date durations.
+"""
+import argparse
+import json
+import shlex
+import subprocess
+import sys
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from scheduling import shard
+from timing_db import TimingDB
+
+
+class Worker:
+    """Host executing one shard of tests."""
+
+    def __init__(self, host, directory, shell, tokens=()):
+        self.host = host
+        self.directory = directory
+        self.shell = shell
+        self.tokens = list(tokens)
+        self.returncode = None
+        self.error = None
+        self.report = None
+        self.timings = None
+        self.tags = None
+
+    def pytest_args(self, pytest_args):
+        """Return pytest arguments with tokens allocated to the worker."""
+        return [*pytest_args,
+                *(f"--with-tokens={token}" for token in self.tokens)]
+
+    def run(self, command, **kwargs):
+        """Execute a shell command in the suite directory on the worker."""
+        command = f"cd {shlex.quote(self.directory)} && {command}"
+        return subprocess.run([*shlex.split(self.shell), self.host, command],
+                              text=True, **kwargs)
+
+    def collect(self, pytest_args):
+        """Return node IDs of tests collected on the worker."""
+        # -v in addopts of pytest.ini would turn off the list of node IDs
+        out = self.run(shlex.join(["python3", "-m", "pytest", "--collect-only",
+                                   "-q", "-o", "addopts=",
+                                   *self.pytest_args(pytest_args)]),
+                       capture_output=True, check=True)
+        tests = []
+        for line in out.stdout.splitlines():
+            if not line.strip():
+                break
+            if "::" in line:
+                tests.append(line.strip())
+        return tests
+
+    def execute(self, tests, pytest_args):
+        """Execute tests and fetch the reports from the worker. An exception
+        (e.g. the remote shell can't be started) is kept in ``error``."""
+        try:
+            self._execute(tests, pytest_args)
+        except Exception as e:
+            self.error = e
+
+    def _execute(self, tests, pytest_args):
+        name = f"/tmp/sc-shard-{uuid.uuid4().hex}"
+        report, timings = f"{name}.xml", f"{name}.json"
+        command = shlex.join(["python3", "-m", "pytest",
+                              *self.pytest_args(pytest_args),
+                              f"--junitxml={report}",
+                              f"--phase-timing-json={timings}", *tests])
+        self.returncode = self.run(command).returncode
+        self.report = self.run(f"cat {report}", capture_output=True).stdout
+        self.timings = self.run(f"cat {timings}", capture_output=True).stdout
+        self.tags = self.run(
+            "python3 -c 'import json, timing_db; "
+            "print(json.dumps(timing_db.platform_tags()))'",
+            capture_output=True).stdout
+        self.run(f"rm -f {report} {timings}")
+
+
+def merge_reports(reports):
+    """Merge JUnit XML reports of workers into one <testsuites> element."""
+    merged = ET.Element("testsuites")
+    for report in reports:
+        if not report:
+            continue
+        root = ET.fromstring(report)
+        suites = [root] if root.tag == "testsuite" else list(root)
+        merged.extend(suites)
+    for key in ("tests", "failures", "errors", "skipped"):
+        merged.set(key, str(sum(int(s.get(key, 0)) for s in merged)))
+    merged.set("time", f"{sum(float(s.get('time', 0)) for s in merged):.3f}")
+    return ET.ElementTree(merged)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        epilog="Arguments after -- are passed to pytest on workers.")
+    parser.add_argument("--worker", action="append", required=True,
+                        dest="workers", help="Worker host, can be used "
+                        "multiple times")
+    parser.add_argument("--directory", default=str(Path(__file__).parent),
+                        help="Directory of the suite on workers, default is "
+                             "the directory of this script")
+    parser.add_argument("--tokens", action="append", default=[],
+                        metavar="HOST=TOKEN[,TOKEN...]",
+                        help="Tokens to be used by the worker, can be used "
+                             "multiple times. Workers without allocated "
+                             "tokens use the default of the suite")
+    parser.add_argument("--shell", default="ssh -o BatchMode=yes",
+                        help="Command executing a shell command on a worker, "
+                             "the worker host is appended")
+    parser.add_argument("--timing-db", default=None,
+                        help="Timing database used for balancing and "
+                             "updated with results")
+    parser.add_argument("--junitxml", default="report.xml",
+                        help="Path of the merged JUnit XML report")
+    parser.add_argument("pytest_args", nargs="*")
+    args = parser.parse_args(argv)
+
+    allocation = {}
+    for value in args.tokens:
+        host, _, tokens = value.partition("=")
+        if host not in args.workers or not tokens:
+            parser.error(f"--tokens {value}: expected HOST=TOKEN[,TOKEN...] "
+                         "with one of the workers")
+        allocation.setdefault(host, []).extend(tokens.split(","))
+    allocated = [t for tokens in allocation.values() for t in tokens]
+    if len(allocated) != len(set(allocated)):
+        parser.error("Each token can be allocated to one worker only")
+
+    workers = [Worker(host, args.directory, args.shell,
+                      allocation.get(host, ()))
+               for host in args.workers]
+    tests = workers[0].collect(args.pytest_args)
+    durations = {}
+    if args.timing_db:
+        db = TimingDB(args.timing_db)
+        durations = db.durations()
+        db.close()
+
+    threads = []
+    started = []
+    shards = shard(tests, durations, len(workers))
+    for worker, shard_tests in zip(workers, shards):
+        if not shard_tests:
+            continue
+        started.append(worker)
+        print(f"{worker.host}: {len(shard_tests)} tests, estimated "
+              f"{sum(durations.get(t, 0) for t in shard_tests):.0f} s")
+        thread = threading.Thread(target=worker.execute,
+                                  args=(shard_tests, args.pytest_args))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    merge_reports(w.report for w in workers).write(args.junitxml,
+                                                   encoding="unicode")
+    print(f"Merged report is written to {args.junitxml}")
+    if args.timing_db:
+        db = TimingDB(args.timing_db)
+        for worker in workers:
+            if worker.timings:
+                db.add_run(json.loads(worker.timings),
+                           json.loads(worker.tags) if worker.tags else
+                           {"host": worker.host})
+        db.close()
+
+    for worker in started:
+        if worker.error is not None:
+            print(f"{worker.host}: {worker.error!r}")
+    # no return code means the worker failed before pytest finished
+    failed = [w.host for w in started if w.returncode not in (0, 5)]
+    if failed:
+        print(f"Tests failed on {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
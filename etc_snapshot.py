@@ -0,0 +1,155 @@
+"""Snapshot and restore of host configuration changed by tests.
+
+With --etc-restore, the configuration subtrees tests change (SUBTREES) are
+copied once at the start of the session with 'cp -a --reflink=auto', so on
+file systems supporting reflinks (XFS, Btrfs) the snapshot shares data with
+the originals and is taken almost instantly. Metadata of every entry is
+recorded as well.
+
+After every test or after the last test of every module (the value of
+--etc-restore), only entries whose metadata differ from the snapshot are put
+back, entries created by tests are removed and sssd is restarted if its
+configuration was touched. Restoring is a walk of the metadata plus copying of
+the changed files, independent of how the test changed them or whether it
+failed midway. The restore is done while holding write locks of all shared
+resources (see resources.py).
+
+Restoring also reverts changes made by session-scoped fixtures, so fixtures
+changing the subtrees are function-scoped and own their changes (e.g.
+https_host adds and removes its /etc/hosts entry for each test).
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from resources import RESOURCES, WRITE
+
+log = logging.getLogger("PyTest")
+
+SUBTREES = ["/etc/sssd", "/etc/pam.d", "/etc/authselect", "/etc/pki",
+            "/etc/hosts"]
+
+
+def _metadata(path):
+    st = os.lstat(path)
+    if os.path.islink(path):
+        return ("l", os.readlink(path))
+    if os.path.isdir(path):
+        return ("d", st.st_mode, st.st_uid, st.st_gid)
+    return ("f", st.st_mode, st.st_uid, st.st_gid, st.st_size, st.st_mtime_ns)
+
+
+def manifest(paths):
+    """Return dictionary mapping all entries of paths to their metadata."""
+    entries = {}
+    for path in paths:
+        if not os.path.lexists(path):
+            continue
+        entries[path] = _metadata(path)
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path):
+                for name in dirs + files:
+                    entry = os.path.join(root, name)
+                    entries[entry] = _metadata(entry)
+    return entries
+
+
+class EtcSnapshot:
+    """Pytest plugin restoring configuration subtrees after tests."""
+
+    def __init__(self, scope, directory=None, paths=SUBTREES, locks=None):
+        """
+        :param scope: 'test' or 'module', when to restore the snapshot
+        :param directory: directory for the snapshot, it should be on the same
+                          file system as /etc for reflinks to work
+        :param paths: subtrees to snapshot
+        :param locks: ResourceLocks plugin
+        """
+        self.scope = scope
+        self.paths = paths
+        self.locks = locks
+        self.directory = Path(directory or tempfile.mkdtemp(
+            prefix="etc-snapshot-", dir="/var/tmp"))
+        self.entries = {}
+
+    def _copy(self, path):
+        return self.directory.joinpath(path.lstrip("/"))
+
+    def take(self):
+        """Copy the subtrees and record their metadata."""
+        for path in self.paths:
+            if not os.path.lexists(path):
+                continue
+            target = self._copy(path)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            subprocess.run(["cp", "-a", "--reflink=auto", path, target],
+                           check=True)
+        self.entries = manifest(self.paths)
+        log.debug("Snapshot of %s entries is in %s", len(self.entries),
+                  self.directory)
+
+    def changed(self):
+        """Return entries that were changed, removed or created."""
+        current = manifest(self.paths)
+        return sorted(path for path in self.entries.keys() | current.keys()
+                      if self.entries.get(path) != current.get(path))
+
+    def restore(self):
+        """Put changed entries back to the snapshot state."""
+        changed = self.changed()
+        copied = []
+        # parents are sorted before their content
+        for path in changed:
+            if any(path.startswith(f"{parent}/") for parent in copied):
+                # content of a directory copied from the snapshot as a whole
+                continue
+            if not os.path.lexists(path) and path not in self.entries:
+                # content of a created directory removed before
+                continue
+            if os.path.lexists(path):
+                if os.path.isdir(path) and not os.path.islink(path):
+                    if path in self.entries \
+                            and self.entries[path][0] == "d":
+                        # restore metadata of existing directory only
+                        shutil.copystat(self._copy(path), path)
+                        st = os.lstat(self._copy(path))
+                        os.chown(path, st.st_uid, st.st_gid)
+                        continue
+                    shutil.rmtree(path)
+                else:
+                    os.unlink(path)
+            if path in self.entries:
+                subprocess.run(["cp", "-a", "--reflink=auto",
+                                self._copy(path), path], check=True)
+                copied.append(path)
+        if changed:
+            log.info("Restored %s entries of the /etc snapshot", len(changed))
+            log.debug("Restored entries: %s", ", ".join(changed))
+        if any(path.startswith("/etc/sssd") for path in changed):
+            subprocess.run(["systemctl", "restart", "sssd"], check=True)
+        return changed
+
+    def _restore_locked(self):
+        if self.locks is None:
+            return self.restore()
+        with self.locks.hold(dict.fromkeys(RESOURCES, WRITE)):
+            return self.restore()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        yield
+        if self.scope == "test" or nextitem is None \
+                or nextitem.path != item.path:
+            self._restore_locked()
+
+    def pytest_sessionfinish(self, session):
+        self._restore_locked()
+
+    def remove(self):
+        """Remove the snapshot."""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -1,62 +1,88 @@
-import pexpect
 import pytest
-import sys
 import logging
 
+from python_freeipa.exceptions import NotFound
 from SCAutolib import run
 from SCAutolib.models.file import SSSDConf
 from SCAutolib.models.user import User
 
+from benchmark import BenchmarkReport
+from capabilities import Capabilities
+from ipa_client import IPABatch
+import recording
+
 
 @pytest.fixture(scope="function")
 def user_shell():
     """Creates shell with some local user as a starting point for test."""
-    shell = pexpect.spawn("/usr/bin/sh -c 'su base-user'", encoding="utf-8")
-    shell.logfile = sys.stdout
+    shell = recording.spawn("/usr/bin/sh -c 'su base-user'", encoding="utf-8")
     return shell
 
 
 @pytest.fixture(scope="function")
 def root_shell():
     """Creates shell with root user as a starting point for test."""
-    shell = pexpect.spawn("/usr/bin/sh -c 'su'", encoding="utf-8")
-    shell.logfile = sys.stdout
+    shell = recording.spawn("/usr/bin/sh -c 'su'", encoding="utf-8")
     return shell
 
 @pytest.fixture(scope="function")
-def allow_sudo_commands(ipa_user):
+def allow_sudo_commands(ipa_user, ipa_server):
     """
     Modifying the IPA server's sudo rules to allow the test user to
     run sudo commands and restore the original state afterward.
+
+    Rule changes are sent to the IPA server in one batch request.
     """
     logger = logging.getLogger()
 
-    logger.debug("Checking if the allow_sudo rule is there.")
-    out = run('ipa sudorule-show allow_sudo'.split(), return_code = [0, 2])
-    if out.returncode == 0:
-        run('ipa sudorule-del allow_sudo'.split())
-        run("systemctl restart sssd".split(), sleep = 10)
-    run('ipa sudorule-add allow_sudo --hostcat=all --runasusercat=all --runasgroupcat=all --cmdcat=all'.split())
-    run(f'ipa sudorule-add-user allow_sudo --user {ipa_user.username}'.split())
+    logger.debug("Replacing the allow_sudo rule on the IPA server.")
+    with IPABatch(ipa_server) as batch:
+        batch.add("sudorule_del", "allow_sudo", ignore=[NotFound])
+        batch.add("sudorule_add", "allow_sudo", hostcategory="all",
+                  ipasudorunasusercategory="all",
+                  ipasudorunasgroupcategory="all", cmdcategory="all")
+        batch.add("sudorule_add_user", "allow_sudo", user=ipa_user.username)
+        # Check that the sudo rule has been added (following call should
+        # succeed)
+        batch.add("sudorule_show", "allow_sudo")
     run("systemctl restart sssd".split(), sleep = 10)
-    logger.debug("Checking that the sudo rule has been added (following command should succeed)")
-    run('ipa sudorule-show allow_sudo'.split())
     yield # running the test's code
-    run('ipa sudorule-del allow_sudo'.split())
+    ipa_server.meta_client.sudorule_del("allow_sudo")
     run("systemctl restart sssd".split(), sleep = 10)
-    logger.debug("Checking that the sudo rule has been removed (following command should exit with status 2)")
-    run('ipa sudorule-show allow_sudo'.split(), return_code = [2])
+    logger.debug("Checking that the sudo rule has been removed (following call should fail with NotFound)")
+    with pytest.raises(NotFound):
+        ipa_server.meta_client.sudorule_show("allow_sudo")
 
 @pytest.fixture(scope="session")
 def root_user():
-    return User.load(username="root")
+    return recording.user("root_user", lambda: User.load(username="root"))
 
 
 @pytest.fixture(scope="session")
 def base_user():
-    return User.load(username="base-user")
+    return recording.user("base_user",
+                          lambda: User.load(username="base-user"))
 
 
 @pytest.fixture(scope="session")
 def sssd():
+    if recording.replaying():
+        return recording.ReplayConfig()
     return SSSDConf()
+
+
+@pytest.fixture(scope="session")
+def capabilities():
+    """Capabilities of the platform, probed once per session."""
+    return Capabilities.probe()
+
+
+@pytest.fixture(scope="session")
+def benchmark(request):
+    """Report collecting results of benchmark tests, written to the file
+    given by --benchmark-json at the end of the session."""
+    report = BenchmarkReport(
+        iterations=request.config.getoption("benchmark_iterations"),
+        concurrency=request.config.getoption("benchmark_concurrency"))
+    yield report
+    report.write(request.config.getoption("benchmark_json"))
@@ -0,0 +1,117 @@
+"""Selection of tests affected by changes of the host.
+
+With --impact-select, inputs the tests depend on are fingerprinted when tests
+are collected:
+
+    * contents of sssd.conf, SSSD CA database and authselect profile files
+      (the selected profile in /etc/authselect and profiles shipped in
+      /usr/share/authselect),
+    * versions of sssd, opensc, pam, authselect and authselect-libs packages
+      (and gdm for graphical tests),
+    * certificates of the loaded cards,
+    * source of the test module and of all harness modules (``*.py`` in the
+      root directory of the suite, e.g. conftest.py, fixtures.py, prompts.py,
+      tls_server.py).
+
+The fingerprint of each passed test is stored in the pytest cache. A test
+whose last passing run has the same fingerprint is skipped, so e.g. an update
+of gdm only reruns the graphical tests.
+"""
+import hashlib
+import logging
+from pathlib import Path
+
+import pytest
+
+from timing_db import package_version
+
+log = logging.getLogger("PyTest")
+
+CACHE_KEY = "impact/passed"
+INPUT_FILES = ["/etc/sssd/sssd.conf", "/etc/sssd/pki/sssd_auth_ca_db.pem"]
+INPUT_DIRS = ["/etc/authselect", "/usr/share/authselect"]
+PACKAGES = ("sssd", "opensc", "pam", "authselect", "authselect-libs")
+GRAPHICAL_PACKAGES = ("gdm",)
+
+
+def _file_digest(path):
+    path = Path(path)
+    if not path.is_file():
+        return "missing"
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _digest(parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def host_inputs(cards):
+    """
+    Return fingerprints of inputs shared by all tests.
+
+    :param cards: loaded cards
+    :return: dictionary mapping names of inputs to their fingerprints
+    """
+    inputs = {path: _file_digest(path) for path in INPUT_FILES}
+    for directory in INPUT_DIRS:
+        for path in sorted(Path(directory).rglob("*")):
+            if path.is_file():
+                inputs[str(path)] = _file_digest(path)
+    for name in PACKAGES + GRAPHICAL_PACKAGES:
+        inputs[name] = package_version(name)
+    for card in cards:
+        cert = getattr(card, "cert", None)
+        inputs[f"card:{card.label}"] = _file_digest(cert) if cert else None
+    return inputs
+
+
+class ImpactSelector:
+    """Pytest plugin skipping tests whose inputs didn't change since they
+    passed."""
+
+    def __init__(self, cache, cards, rootdir):
+        self.cache = cache
+        self.rootdir = Path(rootdir)
+        self.passed = cache.get(CACHE_KEY, {})
+        self.inputs = host_inputs(cards)
+        self.harness = [(path.name, _file_digest(path))
+                        for path in sorted(self.rootdir.glob("*.py"))]
+        self.fingerprints = {}
+        self.failed = set()
+
+    def fingerprint(self, item):
+        inputs = {k: v for k, v in self.inputs.items()
+                  if k not in GRAPHICAL_PACKAGES
+                  or item.get_closest_marker("graphical")}
+        return _digest([item.nodeid, _file_digest(item.path), *self.harness,
+                        *sorted(inputs.items())])
+
+    def pytest_collection_modifyitems(self, config, items):
+        skip = pytest.mark.skip(reason="Inputs didn't change since the test "
+                                       "passed (--impact-select)")
+        skipped = 0
+        for item in items:
+            fingerprint = self.fingerprint(item)
+            self.fingerprints[item.nodeid] = fingerprint
+            if self.passed.get(item.nodeid) == fingerprint:
+                item.add_marker(skip)
+                skipped += 1
+        log.info("%s of %s tests are not affected by changes", skipped,
+                 len(items))
+
+    def pytest_runtest_logreport(self, report):
+        if report.outcome == "failed" or (report.when == "call"
+                                          and report.outcome != "passed"):
+            self.failed.add(report.nodeid)
+        if report.when == "call" and report.outcome == "passed" \
+                and report.nodeid not in self.failed:
+            self.passed[report.nodeid] = self.fingerprints.get(report.nodeid)
+
+    def pytest_sessionfinish(self, session):
+        for nodeid in self.failed:
+            self.passed.pop(nodeid, None)
+        self.cache.set(CACHE_KEY, self.passed)
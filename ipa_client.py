@@ -0,0 +1,151 @@
+"""Helpers for talking to the IPA server used in tests.
+
+The IPA server object (SCAutolib.models.CA.IPAServerCA) already holds an
+authenticated JSON-RPC client in its ``meta_client`` attribute. Helpers in this
+module build on top of it so fixtures don't have to spawn ``ipa`` CLI
+processes for each operation.
+"""
+import logging
+
+from python_freeipa.client_meta import ClientMeta
+from python_freeipa.exceptions import Unauthorized, parse_error
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger("PyTest")
+
+
+class IPASession(ClientMeta):
+    """
+    IPA JSON-RPC client keeping one authenticated session for the whole test
+    run.
+
+    Connections to the server are kept alive in a pool and the session cookie
+    is reused by all requests, so each IPA call costs one HTTP request. When
+    the server expires the session, the client logs in again and repeats the
+    request.
+
+    The host may be any ``host[:port]`` serving the IPA JSON-RPC API over
+    HTTPS (python_freeipa always builds https:// URLs under /ipa), e.g. a
+    local stand-in server with its own CA certificate passed as verify_ssl.
+    """
+
+    def __init__(self, host, username, password, pool_size=4,
+                 verify_ssl=False):
+        """
+        :param host: host[:port] of the IPA JSON-RPC API
+        :param username: user to log in as
+        :param password: password of the user
+        :param pool_size: maximal number of pooled connections
+        :param verify_ssl: path to CA certificate to verify the server
+                           certificate with, True to use system CAs or False
+                           to skip the verification
+        """
+        super().__init__(host, verify_ssl=verify_ssl, dns_discovery=False)
+        self._session.mount("https://", HTTPAdapter(pool_connections=1,
+                                                    pool_maxsize=pool_size))
+        self._credentials = (username, password)
+        self.login(username, password)
+        log.debug("Connected to IPA JSON-RPC API on %s", host)
+
+    @classmethod
+    def from_server(cls, ipa_server, host=None, verify_ssl=False):
+        """
+        Create a session for the IPA server object loaded by SCAutolib.
+
+        :param ipa_server: SCAutolib.models.CA.IPAServerCA object
+        :param host: host[:port] to connect to instead of the IPA server
+                     hostname
+        :param verify_ssl: see IPASession
+        """
+        return cls(host or ipa_server.ipa_server_hostname, "admin",
+                   ipa_server._ipa_server_admin_passwd, verify_ssl=verify_ssl)
+
+    def _request(self, method, args=None, params=None):
+        try:
+            return super()._request(method, args, params)
+        except Unauthorized as e:
+            # Only plain HTTP 401 means that the session cookie has expired,
+            # subclasses are real authorization errors
+            if type(e) is not Unauthorized:
+                raise
+        log.debug("IPA session has expired, logging in again")
+        self.login(*self._credentials)
+        return super()._request(method, args, params)
+
+    def close(self):
+        """Close pooled connections to the server."""
+        self._session.close()
+
+
+class IPABatch:
+    """
+    Collect IPA API calls and submit them in one ``batch`` JSON-RPC request.
+
+    Calls are added with IPA API method names and arguments, e.g.
+
+        with IPABatch(ipa_server) as batch:
+            batch.add("sudorule_add", "allow_sudo", hostcategory="all")
+            batch.add("sudorule_add_user", "allow_sudo", user="ipa-user")
+
+    The batch is submitted when the context is exited without an exception
+    (or when ``submit`` is called explicitly). Results are stored in
+    ``results`` in the order the calls were added.
+    """
+
+    def __init__(self, ipa_server):
+        self._client = ipa_server.meta_client
+        self._calls = []
+        self._ignore = []
+        self.results = []
+
+    def add(self, method, *args, ignore=(), **params):
+        """
+        Add an IPA API call to the batch.
+
+        :param method: IPA API method name, e.g. ``user_add``
+        :param args: positional arguments of the method
+        :param ignore: exception classes from python_freeipa.exceptions which
+                       should not be raised when the call fails, e.g.
+                       ``NotFound`` when deleting an entry that may not exist
+        :param params: options of the method
+        :return: index of the call in the batch results
+        """
+        params.setdefault("version", self._client.version)
+        self._calls.append({"method": method, "params": [list(args), params]})
+        self._ignore.append(tuple(ignore))
+        return len(self.results) + len(self._calls) - 1
+
+    def submit(self):
+        """
+        Send all collected calls to the IPA server in one request.
+
+        The first failed call that is not ignored is raised as the matching
+        python_freeipa exception. Ignored failures are kept in ``results``
+        with the ``error`` key set.
+
+        :return: list of results of individual calls
+        """
+        calls, ignore = self._calls, self._ignore
+        self._calls, self._ignore = [], []
+        if not calls:
+            return self.results
+        log.debug("Submitting batch of %s IPA calls: %s", len(calls),
+                  ", ".join(c["method"] for c in calls))
+        results = self._client.batch(a_methods=calls)["results"]
+        self.results.extend(results)
+        for call, result, ignored in zip(calls, results, ignore):
+            if not result.get("error"):
+                continue
+            try:
+                parse_error({"message": result["error"],
+                             "code": result.get("error_code")})
+            except ignored as e:
+                log.debug("Ignoring failure of %s: %s", call["method"], e)
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.submit()
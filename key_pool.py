@@ -0,0 +1,143 @@
+"""Pool of pre-generated private keys.
+
+Generating an RSA key is CPU heavy and used to happen directly on the setup
+path of fixtures. The pool generates keys in a background thread, keeps them on
+disk between test sessions and hands them out without waiting.
+"""
+import logging
+import os
+import shutil
+import threading
+import uuid
+from collections import deque
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+log = logging.getLogger("PyTest")
+
+EC_CURVES = {256: ec.SECP256R1, 384: ec.SECP384R1, 521: ec.SECP521R1}
+
+
+def gen_private_key(algorithm="rsa", size=2048):
+    """
+    Generate an unencrypted private key in PEM format.
+
+    :param algorithm: ``rsa`` or ``ec``
+    :param size: key size in bits for RSA, curve size for EC
+    :return: private key in PEM format
+    """
+    if algorithm == "rsa":
+        key = rsa.generate_private_key(public_exponent=65537, key_size=size)
+    elif algorithm == "ec":
+        key = ec.generate_private_key(EC_CURVES[size]())
+    else:
+        raise ValueError(f"Unknown key algorithm: {algorithm}")
+    return key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption())
+
+
+class KeyPool:
+    """
+    Keys stored in ``directory``, one subdirectory per algorithm and size.
+
+    The background thread keeps ``size`` keys ready for each spec given in
+    ``specs``. Directories are only accessible by the owner, keys are written
+    under a temporary name and renamed when complete, so a key interrupted
+    in the middle of the write is never handed out.
+    """
+
+    def __init__(self, directory, size=2, specs=(("rsa", 2048),)):
+        self.directory = Path(directory)
+        self.directory.chmod(0o700)
+        self.size = size
+        self.specs = list(specs)
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        for spec in self.specs:
+            self._load(spec)
+
+    def _spec_dir(self, spec):
+        algorithm, size = spec
+        spec_dir = self.directory.joinpath(f"{algorithm}-{size}")
+        spec_dir.mkdir(mode=0o700, exist_ok=True)
+        return spec_dir
+
+    def _load(self, spec):
+        spec_dir = self._spec_dir(spec)
+        for tmp in spec_dir.glob("*.tmp"):
+            tmp.unlink()
+        self._keys[spec] = deque(spec_dir.glob("*.pem"))
+        log.debug("%s %s keys are ready in the pool", len(self._keys[spec]),
+                  spec)
+
+    def _generate(self, spec):
+        spec_dir = self._spec_dir(spec)
+        name = uuid.uuid4().hex
+        tmp = spec_dir.joinpath(f"{name}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(gen_private_key(*spec))
+        return tmp.rename(spec_dir.joinpath(f"{name}.pem"))
+
+    def _fill(self):
+        while not self._stop.is_set():
+            for spec in self.specs:
+                while len(self._keys[spec]) < self.size:
+                    if self._stop.is_set():
+                        return
+                    key = self._generate(spec)
+                    with self._lock:
+                        self._keys[spec].append(key)
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+    def start(self):
+        """Start generating keys in the background."""
+        if self.size <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(name="key_pool", target=self._fill,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background generation. Ready keys are kept on disk."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def take(self, key_path, algorithm="rsa", size=2048):
+        """
+        Move a ready key to ``key_path``.
+
+        If there is no ready key, the key is generated synchronously.
+
+        :param key_path: path where the private key should be stored
+        :param algorithm: ``rsa`` or ``ec``
+        :param size: key size in bits for RSA, curve size for EC
+        :return: path to the private key
+        """
+        spec = (algorithm, size)
+        key = None
+        with self._lock:
+            if self._keys.get(spec):
+                key = self._keys[spec].popleft()
+        self._wakeup.set()
+        if key is None:
+            log.debug("No %s key is ready in the pool, generating", spec)
+            fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(gen_private_key(algorithm, size))
+        else:
+            shutil.move(key, key_path)
+        return Path(key_path)
@@ -0,0 +1,76 @@
+"""Reduction of parametrization matrices to covering arrays.
+
+Parametrized tests run the full product of their parameters, e.g.
+``required × lock_on_removal × user``. With --matrix-strength T, only a subset
+of the generated variants of each test is kept such that every combination of
+values of any T parameters that appears in the full matrix is still executed
+(T=2 is pairwise testing). The subset is picked greedily from the generated
+variants, so combinations excluded by explicit parameter lists (e.g.
+``required,insert,expect,secret``) are never created.
+
+Only tests with more than T parameters having several values are reduced. In
+this suite these are tests parametrized by ``required,lock_on_removal`` and
+``user`` with --with-user-type all (8 variants, 4 with T=2) and the PAM
+benchmark with several --benchmark-pam-service (e.g. 16 variants, 6 with
+T=2). With the default local user nothing is reduced; the option pays off as
+more axes (e.g. cards or certificates) are parametrized.
+"""
+from itertools import combinations
+
+
+def _key(value):
+    try:
+        hash(value)
+    except TypeError:
+        return id(value)
+    return value
+
+
+def interactions(params, strength):
+    """Return combinations of values of strength parameters."""
+    names = sorted(params)
+    return {tuple((name, _key(params[name])) for name in combo)
+            for combo in combinations(names, min(strength, len(names)))}
+
+
+def covering(variants, strength):
+    """
+    Select variants covering all interactions of strength parameters.
+
+    :param variants: list of dictionaries mapping parameter names to values
+    :param strength: number of parameters whose value combinations have to be
+                     covered
+    :return: sorted indices of the selected variants
+    """
+    covers = [interactions(params, strength) for params in variants]
+    uncovered = set().union(*covers)
+    selected = []
+    while uncovered:
+        best = max(range(len(variants)),
+                   key=lambda i: len(covers[i] & uncovered))
+        selected.append(best)
+        uncovered -= covers[best]
+    return sorted(selected)
+
+
+def reduce_matrix(items, strength):
+    """
+    Split items into the ones covering the parametrization of their tests and
+    the redundant ones.
+
+    :param items: collected pytest items
+    :param strength: number of interacting parameters to cover
+    :return: tuple of lists (kept, deselected) of items
+    """
+    tests = {}
+    for item in items:
+        if hasattr(item, "callspec"):
+            tests.setdefault((item.parent.nodeid, item.originalname),
+                             []).append(item)
+    redundant = set()
+    for variants in tests.values():
+        keep = covering([v.callspec.params for v in variants], strength)
+        redundant.update(v.nodeid for i, v in enumerate(variants)
+                         if i not in keep)
+    return ([item for item in items if item.nodeid not in redundant],
+            [item for item in items if item.nodeid in redundant])
@@ -0,0 +1,213 @@
+"""Pytest plugin splitting wall time of tests into phases.
+
+Besides setup, call and teardown reported by pytest, time spent in these
+operations is measured inside of each test:
+
+    authselect_enter, authselect_exit - Authselect context manager
+    card_insert, card_remove          - insert()/remove() of virtual and
+                                        physical cards
+    sssd_restart                      - 'systemctl start/restart sssd'
+                                        executed by tests, fixtures or
+                                        SCAutolib
+    auth_wait                         - waiting for output of pexpect shells
+                                        (prompts and results of
+                                        authentication)
+
+Phases are measured by wrapping the SCAutolib and pexpect functions, so nested
+phases are included in the enclosing ones (e.g. sssd_restart done by
+Authselect is part of authselect_enter too).
+
+The plugin is enabled by --phase-timing-json and/or --phase-timing-openmetrics.
+The OpenMetrics file can be read by the textfile collector of Prometheus node
+exporter.
+"""
+import json
+import logging
+import os
+import subprocess
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+import pexpect
+import pytest
+
+from SCAutolib.models.authselect import Authselect
+from SCAutolib.models.card import PhysicalCard, VirtualCard
+
+log = logging.getLogger("PyTest")
+
+METRIC_PREFIX = "sc_tests"
+
+# (object, attribute, phase)
+WRAPPED = [
+    (Authselect, "__enter__", "authselect_enter"),
+    (Authselect, "__exit__", "authselect_exit"),
+    (VirtualCard, "insert", "card_insert"),
+    (VirtualCard, "remove", "card_remove"),
+    (PhysicalCard, "insert", "card_insert"),
+    (PhysicalCard, "remove", "card_remove"),
+    (pexpect.spawn, "expect", "auth_wait"),
+    (pexpect.spawn, "expect_exact", "auth_wait"),
+]
+
+
+def _is_sssd_restart(cmd):
+    if isinstance(cmd, str):
+        cmd = cmd.split()
+    cmd = [str(c) for c in cmd]
+    return (len(cmd) >= 3 and cmd[0].endswith("systemctl")
+            and cmd[1] in ("start", "restart") and "sssd" in cmd[2:])
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r'\"') \
+        .replace("\n", r"\n")
+
+
+class PhaseTimer:
+    """
+    Collects durations of phases of each test.
+
+    ``results`` maps test node IDs to dictionaries with the outcome of the test
+    and durations (``phases``) and number of occurrences (``counts``) of its
+    phases.
+    """
+
+    def __init__(self, json_path=None, openmetrics_path=None):
+        self.json_path = json_path
+        self.openmetrics_path = openmetrics_path
+        self.results = {}
+        self._current = None
+        self._lock = threading.Lock()
+        self._originals = []
+
+    def _result(self, nodeid):
+        return self.results.setdefault(nodeid, {
+            "outcome": None,
+            "phases": defaultdict(float),
+            "counts": defaultdict(int),
+        })
+
+    def add(self, phase, duration, nodeid=None):
+        """Add duration of a phase to the current (or given) test."""
+        nodeid = nodeid or self._current
+        if nodeid is None:
+            return
+        with self._lock:
+            result = self._result(nodeid)
+            result["phases"][phase] += duration
+            result["counts"][phase] += 1
+
+    @contextmanager
+    def phase(self, name):
+        """Measure the block as a phase of the current test."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - start)
+
+    def _wrap(self, func, phase):
+        timer = self
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer.phase(phase):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def _wrap_subprocess_run(self, func):
+        timer = self
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cmd = args[0] if args else kwargs.get("args")
+            if not _is_sssd_restart(cmd):
+                return func(*args, **kwargs)
+            with timer.phase("sssd_restart"):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def install(self):
+        """Wrap measured functions."""
+        for obj, attr, phase in WRAPPED:
+            original = getattr(obj, attr)
+            self._originals.append((obj, attr, obj.__dict__.get(attr)))
+            setattr(obj, attr, self._wrap(original, phase))
+        self._originals.append((subprocess, "run", subprocess.run))
+        subprocess.run = self._wrap_subprocess_run(subprocess.run)
+
+    def uninstall(self):
+        """Restore original functions."""
+        for obj, attr, original in reversed(self._originals):
+            if original is None:
+                # the attribute was inherited
+                delattr(obj, attr)
+            else:
+                setattr(obj, attr, original)
+        self._originals = []
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self._current = item.nodeid
+        yield
+        self._current = None
+
+    def pytest_runtest_logreport(self, report):
+        with self._lock:
+            result = self._result(report.nodeid)
+            result["phases"][report.when] += report.duration
+            result["counts"][report.when] += 1
+            if report.when == "call" or report.outcome != "passed":
+                result["outcome"] = report.outcome
+
+    def to_dict(self):
+        return {nodeid: {"outcome": r["outcome"],
+                         "phases": dict(r["phases"]),
+                         "counts": dict(r["counts"])}
+                for nodeid, r in self.results.items()}
+
+    def to_openmetrics(self):
+        lines = [
+            f"# TYPE {METRIC_PREFIX}_phase_seconds gauge",
+            f"# HELP {METRIC_PREFIX}_phase_seconds Time spent in the phase "
+            "of the test.",
+            f"# UNIT {METRIC_PREFIX}_phase_seconds seconds",
+        ]
+        counts = [
+            f"# TYPE {METRIC_PREFIX}_phase_count gauge",
+            f"# HELP {METRIC_PREFIX}_phase_count Number of occurrences of "
+            "the phase in the test.",
+        ]
+        outcomes = [
+            f"# TYPE {METRIC_PREFIX}_test_passed gauge",
+            f"# HELP {METRIC_PREFIX}_test_passed 1 if the test passed, "
+            "0 otherwise.",
+        ]
+        for nodeid, r in self.results.items():
+            test = _escape(nodeid)
+            for phase, duration in r["phases"].items():
+                labels = f'test="{test}",phase="{_escape(phase)}"'
+                lines.append(f"{METRIC_PREFIX}_phase_seconds{{{labels}}} "
+                             f"{duration:.6f}")
+                counts.append(f"{METRIC_PREFIX}_phase_count{{{labels}}} "
+                              f"{r['counts'][phase]}")
+            outcomes.append(f'{METRIC_PREFIX}_test_passed{{test="{test}"}} '
+                            f"{int(r['outcome'] == 'passed')}")
+        return "\n".join(lines + counts + outcomes + ["# EOF", ""])
+
+    def pytest_sessionfinish(self, session):
+        if self.json_path:
+            with open(self.json_path, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
+            log.info("Phase timings are written to %s", self.json_path)
+        if self.openmetrics_path:
+            # write atomically, so the exporter never reads a partial file
+            tmp = f"{self.openmetrics_path}.tmp"
+            with open(tmp, "w") as f:
+                f.write(self.to_openmetrics())
+            os.replace(tmp, self.openmetrics_path)
+            log.info("Phase timings are written to %s", self.openmetrics_path)
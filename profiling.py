@@ -0,0 +1,107 @@
+"""Pytest plugin profiling the harness code of tests.
+
+Enabled by --profile-dir. The plugin profiles pytest_configure of conftest
+(loading of users, cards and IPA client) and the whole run of each selected
+test (--profile-select), i.e. fixtures, test code and SCAutolib calls. Time
+spent in the system under test shows up as waiting in subprocess or pexpect
+calls.
+
+For each profiled part, cProfile statistics are saved to
+``<profile dir>/<name>.prof`` (open them with pstats, snakeviz, ...). In
+addition, all Python threads are sampled and the stacks are merged into
+``<profile dir>/profile.collapsed`` in collapsed-stack format usable by
+flamegraph.pl or speedscope.
+"""
+import cProfile
+import logging
+import re
+import sys
+import threading
+from collections import Counter
+from fnmatch import fnmatch
+from pathlib import Path
+from time import sleep
+
+import pytest
+
+log = logging.getLogger("PyTest")
+
+SAMPLE_INTERVAL = 0.005
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{Path(code.co_filename).name}:{code.co_name}:{frame.f_lineno}"
+
+
+class Profiler:
+    """Collects cProfile statistics and stack samples of profiled parts."""
+
+    def __init__(self, directory, select=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.select = select or ["*"]
+        self.stacks = Counter()
+        self._name = None
+        self._profile = None
+        self._done = threading.Event()
+        self._sampler = threading.Thread(name="profiler", target=self._sample,
+                                         daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._done.is_set():
+            name = self._name
+            if name is not None:
+                threads = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame))
+                        frame = frame.f_back
+                    stack.append(threads.get(ident, str(ident)))
+                    stack.append(name)
+                    self.stacks[";".join(reversed(stack))] += 1
+            sleep(SAMPLE_INTERVAL)
+
+    def selected(self, nodeid):
+        return any(fnmatch(nodeid, pattern) for pattern in self.select)
+
+    def start(self, name):
+        """Start profiling a part of the run called name."""
+        self._name = name
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        """Stop profiling and save cProfile statistics."""
+        self._profile.disable()
+        path = self.directory.joinpath(
+            re.sub(r"[^\w.-]+", "_", self._name) + ".prof")
+        self._profile.dump_stats(path)
+        log.debug("Profile of %s is saved to %s", self._name, path)
+        self._name = None
+        self._profile = None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        if not self.selected(item.nodeid):
+            yield
+            return
+        self.start(item.nodeid)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def pytest_sessionfinish(self, session):
+        self._done.set()
+        self._sampler.join()
+        path = self.directory.joinpath("profile.collapsed")
+        with path.open("w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        log.info("Profiles are saved to %s", self.directory)
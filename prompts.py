@@ -0,0 +1,69 @@
+"""Catalogue of prompts and messages of authentication in shells.
+
+All known events are combined into one regular expression with a named group
+per event, so the output of a shell is searched once for all of them and the
+first event that arrives wins:
+
+    event = PROMPTS.expect(shell, ["cert_select", "pin", "failure"])
+    if event.name == "pin":
+        shell.sendline(sc.pin)
+
+Patterns must not contain capturing groups, the name of the matching event is
+the name of the only group that matched.
+"""
+import re
+from collections import namedtuple
+
+Event = namedtuple("Event", "name text match")
+
+EVENTS = {
+    "cert_select": r"select a certificate",
+    "pin": r"PIN for [^\n]*?:|Enter Password or Pin for \"[^\"\n]*\":",
+    "password": r"(?:[cC]urrent |\[sudo\] )?[pP]assword(?: for [^\n:]*)?:",
+    "insert_card": r"Please (?:\(re\))?(?:insert|enter) (?:\(different\) )?"
+                   r"[sS]mart ?[cC]ard",
+    "success": r"pam_authenticate for user \[[^\]\n]*\]: Success",
+    "failure": r"Login incorrect|Authentication failure|Sorry, try again"
+               r"|Permission denied"
+               r"|pam_authenticate for user \[[^\]\n]*\]: (?!Success)[^\n]+",
+    "shell_prompt": r"[$#] \Z",
+}
+
+
+class PromptCatalogue:
+    """Classifies shell output into events."""
+
+    def __init__(self, events=None):
+        self.events = dict(events or EVENTS)
+        for name, pattern in self.events.items():
+            if re.compile(pattern).groups:
+                raise ValueError(f"Pattern of {name} has capturing groups")
+        self._compiled = {}
+
+    def pattern(self, names=None):
+        """Return one compiled expression matching any of the events."""
+        names = tuple(names or self.events)
+        if names not in self._compiled:
+            self._compiled[names] = re.compile("|".join(
+                f"(?P<{name}>{self.events[name]})" for name in names))
+        return self._compiled[names]
+
+    def classify(self, text, names=None):
+        """Return all events in text, in order of appearance."""
+        return [Event(m.lastgroup, m.group(), m)
+                for m in self.pattern(names).finditer(text)]
+
+    def expect(self, shell, names=None, timeout=-1):
+        """
+        Wait for the first of the events in the output of a pexpect shell.
+
+        :param shell: pexpect spawn object
+        :param names: names of expected events, all by default
+        :param timeout: timeout in seconds, default of the shell by default
+        :return: Event that arrived
+        """
+        shell.expect(self.pattern(names), timeout=timeout)
+        return Event(shell.match.lastgroup, shell.match.group(), shell.match)
+
+
+PROMPTS = PromptCatalogue()
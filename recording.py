@@ -0,0 +1,345 @@
+"""Recording and replay of pexpect shells.
+
+Shells of fixtures and login_shell_factory are created by ``spawn``. With
+--record-dir, everything sent to a shell and received from it is recorded
+with timestamps to ``<record dir>/<test>.<n>.jsonl`` (n-th shell of the
+test). Recordings contain PINs and passwords sent by the tests.
+
+ReplaySpawn serves a recording back without running any program: output is
+returned up to the point where the recorded program waited for input, sent
+data is compared with the recorded input and the rest of the pexpect API
+(expect, expect_exact, before, after, match, TIMEOUT, EOF) behaves as with the
+real shell. It allows checking prompt handling (enter_pin, check_multicert,
+PROMPTS) and new test code against recordings on any machine:
+
+    shell = ReplaySpawn("recordings/test_su_login_with_sc.0.jsonl")
+    enter_pin(shell, sc)
+
+Users and their cards are recorded to ``<record dir>/session.json`` when they
+are loaded (``user``). With --replay-dir, the suite runs without a
+provisioned host:
+
+* ``spawn`` returns ReplaySpawn of the recording of the running test instead
+  of starting the program; tests without a recording are skipped,
+* users are ReplayUser objects created from the recorded session, their
+  cards are ReplayCard objects whose insertion and removal do nothing;
+  tests needing a user missing in the session are skipped,
+* Authselect and the sssd fixture don't change the host configuration.
+
+Tests talking to the host in other ways (IPA server, running commands, GUI)
+can't be replayed.
+"""
+import json
+import re
+import threading
+from pathlib import Path
+from time import perf_counter
+
+import pexpect
+import pytest
+from pexpect.spawnbase import SpawnBase
+
+import transcript
+
+
+SESSION = "session.json"
+
+
+class ReplayError(AssertionError):
+    """Test sent different input than the one in the recording."""
+
+
+class _Channel:
+    """File-like object recording one direction of the shell traffic."""
+
+    def __init__(self, recording, direction):
+        self.recording = recording
+        self.direction = direction
+
+    def write(self, data):
+        self.recording.add(self.direction, data)
+
+    def flush(self):
+        pass
+
+
+class Recording:
+    """Timestamped traffic of one shell, written as JSON lines."""
+
+    def __init__(self, path, command):
+        self._file = open(path, "w")
+        self._lock = threading.Lock()
+        self._start = perf_counter()
+        self._file.write(json.dumps({"command": command}) + "\n")
+
+    def add(self, direction, data):
+        with self._lock:
+            self._file.write(json.dumps({
+                "t": round(perf_counter() - self._start, 6),
+                "dir": direction, "data": data}) + "\n")
+            self._file.flush()
+
+    def attach(self, shell):
+        """Record traffic of a pexpect shell."""
+        shell.logfile_read = _Channel(self, "recv")
+        shell.logfile_send = _Channel(self, "send")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def load(path):
+    """Return command and events of a recording."""
+    with open(path) as f:
+        header = json.loads(f.readline())
+        return header["command"], [json.loads(line) for line in f]
+
+
+class ReplaySpawn(SpawnBase):
+    """pexpect spawn object serving a recorded shell."""
+
+    def __init__(self, path, timeout=30, maxread=2000, searchwindowsize=None,
+                 logfile=None, encoding="utf-8", strict=True):
+        """
+        :param path: path to the recording
+        :param strict: raise ReplayError when sent data differ from the
+                       recording
+        """
+        super().__init__(timeout=timeout, maxread=maxread,
+                         searchwindowsize=searchwindowsize, logfile=logfile,
+                         encoding=encoding)
+        self.command, self.events = load(path)
+        self.strict = strict
+        self.position = 0
+        self.closed = False
+
+    def _next(self, direction):
+        """Return index of the next event in given direction or None."""
+        for index in range(self.position, len(self.events)):
+            if self.events[index]["dir"] == direction:
+                return index
+        return None
+
+    def read_nonblocking(self, size=1, timeout=None):
+        if self.position >= len(self.events):
+            self.flag_eof = True
+            raise pexpect.EOF("End of the recording")
+        event = self.events[self.position]
+        if event["dir"] == "send":
+            # the recorded program waited for input here
+            raise pexpect.TIMEOUT("Recorded program waits for input: "
+                                  f"{event['data']!r}")
+        data = event["data"][:size]
+        rest = event["data"][size:]
+        if rest:
+            self.events[self.position] = dict(event, data=rest)
+        else:
+            self.position += 1
+        self._log(data, "read")
+        return data
+
+    def send(self, s):
+        s = self._coerce_send_string(s)
+        self._log(s, "send")
+        index = self._next("send")
+        if index is None:
+            if self.strict:
+                raise ReplayError(f"Nothing more was sent in the recording, "
+                                  f"got {s!r}")
+            return len(s)
+        expected = self.events[index]["data"]
+        if self.strict and expected != s:
+            raise ReplayError(f"Recording sent {expected!r}, got {s!r}")
+        # output recorded before the input stays readable, as it would stay
+        # in the buffer of a real terminal
+        del self.events[index]
+        return len(s)
+
+    def sendline(self, s=""):
+        return self.send(s + self.linesep)
+
+    def sendcontrol(self, char):
+        return self.send(chr(ord(char.lower()) & 0x1f))
+
+    def isalive(self):
+        return not self.closed and self.position < len(self.events)
+
+    def close(self, force=True):
+        self.closed = True
+
+
+class ReplayCard:
+    """Card of a recorded session. Inserting and removing it does nothing."""
+
+    def __init__(self, name, pin, label=None, cardholder=None):
+        self.name = name
+        self.pin = pin
+        self.label = label
+        self.cardholder = cardholder
+
+    def insert(self, *args, **kwargs):
+        pass
+
+    def remove(self):
+        pass
+
+    def __call__(self, insert=False):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class ReplayUser:
+    """User of a recorded session with cards available as card_0, card_1,
+    ... and card (the first one), like users loaded in conftest."""
+
+    def __init__(self, username, password=None, user_type=None, cards=()):
+        self.username = username
+        self.password = password
+        self.user_type = user_type
+        self.total_cards = len(cards)
+        for index, card in enumerate(cards):
+            setattr(self, f"card_{index}", ReplayCard(**card))
+        if cards:
+            self.card = self.card_0
+            self.pin = self.card.pin
+
+
+class ReplayConfig:
+    """Stands in for a configuration context manager (e.g. SSSDConf)."""
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+def describe(user):
+    """Return attributes of a user and their cards used by the tests."""
+    cards = [getattr(user, f"card_{index}")
+             for index in range(getattr(user, "total_cards", 0))]
+    return {
+        "username": user.username,
+        "password": getattr(user, "password", None),
+        "user_type": getattr(user, "user_type", None),
+        "cards": [{"name": getattr(card, "name", None), "pin": card.pin,
+                   "label": getattr(card, "label", None),
+                   "cardholder": getattr(card, "cardholder", None)}
+                  for card in cards],
+    }
+
+
+class ShellRecorder:
+    """Pytest plugin recording or replaying shells of running tests."""
+
+    def __init__(self, record_dir=None, replay_dir=None):
+        self.record_dir = Path(record_dir) if record_dir else None
+        self.replay_dir = Path(replay_dir) if replay_dir else None
+        self.users = {}
+        if self.record_dir:
+            self.record_dir.mkdir(parents=True, exist_ok=True)
+        if self.replay_dir:
+            session = self.replay_dir.joinpath(SESSION)
+            if not session.exists():
+                raise pytest.UsageError(f"{session} doesn't exist, record "
+                                        "the session with --record-dir")
+            self.users = json.loads(session.read_text())["users"]
+        self.test = None
+        self.count = 0
+        self.recordings = []
+
+    def user(self, key, load):
+        """Return recorded user when replaying, otherwise call load() and
+        record the user when recording. User missing in the recorded session
+        is None like a user of unselected type, a test needing it is
+        skipped."""
+        if self.replay_dir:
+            if key not in self.users:
+                if self.test:
+                    pytest.skip(f"{key} isn't in the recorded session "
+                                f"{self.replay_dir}")
+                return None
+            return ReplayUser(**self.users[key])
+        user = load()
+        if self.record_dir:
+            self.users[key] = describe(user)
+            self.record_dir.joinpath(SESSION).write_text(
+                json.dumps({"users": self.users}, indent=2))
+        return user
+
+    def path(self, directory):
+        name = re.sub(r"[^\w.-]+", "_", self.test)
+        path = directory.joinpath(f"{name}.{self.count}.jsonl")
+        self.count += 1
+        return path
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self.test, self.count = item.nodeid, 0
+        try:
+            yield
+        finally:
+            for recording in self.recordings:
+                recording.close()
+            self.test, self.recordings = None, []
+
+
+_recorder = None
+
+
+def spawn(command, **kwargs):
+    """
+    Start a shell logging to the transcript of the running test. The shell
+    is recorded or replayed when requested by ShellRecorder.
+
+    :param command: command to be executed
+    :param kwargs: arguments of pexpect.spawn
+    :return: pexpect.spawn or ReplaySpawn object
+    """
+    recorder = _recorder if _recorder is not None and _recorder.test else None
+    if recorder and recorder.replay_dir:
+        path = recorder.path(recorder.replay_dir)
+        if not path.exists():
+            pytest.skip(f"{recorder.test} has no recording {path}")
+        shell = ReplaySpawn(path, encoding=kwargs.get("encoding", "utf-8"))
+    else:
+        shell = pexpect.spawn(command, **kwargs)
+        if recorder and recorder.record_dir:
+            recording = Recording(recorder.path(recorder.record_dir), command)
+            recording.attach(shell)
+            recorder.recordings.append(recording)
+    shell.logfile = transcript.current()
+    return shell
+
+
+def user(key, load):
+    """
+    Return a user of the session, see ShellRecorder.user.
+
+    :param key: name of the user in the recorded session, e.g. local_user
+    :param load: function loading the user on the host
+    :return: loaded user or ReplayUser
+    """
+    if _recorder is None:
+        return load()
+    return _recorder.user(key, load)
+
+
+def replaying():
+    """Return True if shells and users are replayed."""
+    return _recorder is not None and _recorder.replay_dir is not None
+
+
+def install(recorder):
+    """Make spawn use the recorder."""
+    global _recorder
+    _recorder = recorder
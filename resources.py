@@ -0,0 +1,135 @@
+"""Locks of host state shared by tests.
+
+Tests change global state of the host. Each piece of such state is a named
+resource and tests declare what they touch by markers:
+
+    @pytest.mark.reads("sssd_auth_ca_db")
+    @pytest.mark.writes("authselect", "cards")
+    def test_...
+
+Before a test runs (including setup and teardown of its fixtures), the
+ResourceLocks plugin takes a shared lock of every resource the test reads and
+an exclusive lock of every resource it writes. The locks are flock(2) locks of
+files in --resource-lock-dir, so they are respected by all pytest processes on
+the host (e.g. pytest-xdist workers or several runs of the suite) and tests
+that don't conflict can run at the same time.
+
+Some fixtures imply resources (FIXTURE_RESOURCES) and graphical tests write
+the graphical seat. A test without reads/writes markers is assumed to touch
+everything, so undeclared tests never run concurrently with other tests.
+"""
+import fcntl
+import logging
+import os
+import tempfile
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from time import perf_counter
+
+import pytest
+
+log = logging.getLogger("PyTest")
+
+READ = "read"
+WRITE = "write"
+
+# resource name: what it stands for
+RESOURCES = {
+    "sssd_conf": "/etc/sssd/sssd.conf (restarts sssd)",
+    "authselect": "authselect profile and PAM configuration "
+                  "(restarts sssd)",
+    "hosts": "/etc/hosts",
+    "pam_cert_service": "/etc/pam.d/pam_cert_service",
+    "sssd_auth_ca_db": "/etc/sssd/pki/sssd_auth_ca_db.pem",
+    "cards": "inserted/removed state of the cards",
+    "graphical_seat": "GDM on the physical seat",
+}
+
+FIXTURE_RESOURCES = {
+    "sssd": {"sssd_conf": WRITE},
+    "https_host": {"hosts": WRITE},
+}
+
+
+def requirements(item):
+    """
+    Return resources the test touches.
+
+    :param item: pytest test item
+    :return: dictionary mapping resource names to READ or WRITE
+    """
+    required = {}
+    declared = False
+    for mode, marker in ((READ, "reads"), (WRITE, "writes")):
+        for mark in item.iter_markers(marker):
+            declared = True
+            for name in mark.args:
+                if required.get(name) != WRITE:
+                    required[name] = mode
+    if item.get_closest_marker("graphical"):
+        required["graphical_seat"] = WRITE
+    for fixture in item.fixturenames:
+        for name, mode in FIXTURE_RESOURCES.get(fixture, {}).items():
+            if required.get(name) != WRITE:
+                required[name] = mode
+    if not declared:
+        return dict.fromkeys(RESOURCES, WRITE)
+    return required
+
+
+class ResourceLocks:
+    """Pytest plugin holding locks of resources while tests run."""
+
+    def __init__(self, directory):
+        """
+        :param directory: directory with lock files. When it can't be created
+                          (e.g. /run/lock for a non-root user), a directory
+                          in $XDG_RUNTIME_DIR or in the temporary directory
+                          is used, shared only by processes of the same user.
+        """
+        self.directory = Path(directory)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            fallback = Path(os.environ.get("XDG_RUNTIME_DIR")
+                            or tempfile.gettempdir(),
+                            f"sc-tests-{os.getuid()}")
+            log.warning("Can't use %s for resource locks (%s), using %s",
+                        self.directory, e, fallback)
+            self.directory = fallback
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    @contextmanager
+    def hold(self, required):
+        """Lock resources, in sorted order to avoid deadlocks."""
+        with ExitStack() as stack:
+            for name in sorted(required):
+                fd = os.open(self.directory.joinpath(f"{name}.lock"),
+                             os.O_RDWR | os.O_CREAT, 0o600)
+                stack.callback(os.close, fd)
+                operation = (fcntl.LOCK_EX if required[name] == WRITE
+                             else fcntl.LOCK_SH)
+                start = perf_counter()
+                fcntl.flock(fd, operation)
+                stack.callback(fcntl.flock, fd, fcntl.LOCK_UN)
+                waited = perf_counter() - start
+                if waited > 0.1:
+                    log.debug("Waited %.1f s for %s lock of %s", waited,
+                              required[name], name)
+            yield
+
+    def pytest_collection_modifyitems(self, config, items):
+        for item in items:
+            for marker in ("reads", "writes"):
+                for mark in item.iter_markers(marker):
+                    unknown = set(mark.args) - set(RESOURCES)
+                    if unknown:
+                        raise pytest.UsageError(
+                            f"{item.nodeid}: unknown resources "
+                            f"{', '.join(sorted(unknown))}, known are "
+                            f"{', '.join(RESOURCES)}")
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        with self.hold(requirements(item)):
+            yield
@@ -0,0 +1,213 @@
+"""Scheduling of tests by their recorded durations.
+
+Durations come from the timing database (--timing-db, see timing_db.py).
+Tests without history are assumed to take the median duration of the known
+ones.
+
+Tests of one module are kept together and in collection order: modules group
+tests by the configuration they need (IPA client, graphical seat, module-level
+markers and fixtures), so a module is never split between shards. Modules are
+assigned to shards longest first, each to the currently shortest shard, and
+then groups are moved or swapped between the longest and the shortest shard
+while it shortens the longest one (tail balancing).
+
+The Scheduler plugin can
+
+* run only one shard of the suite (--shard K/N), e.g. on N CI hosts,
+* order modules longest first (--schedule-longest-first), so the slowest ones
+  don't end up queued at the end of the run,
+* select the most valuable tests fitting into a wall-clock budget
+  (--time-budget). Tests that failed in their last run are worth
+  FAILED_VALUE, tests without history NEW_VALUE and others 1. Tests are
+  picked greedily by value per second.
+
+The plugin runs after the other pytest_collection_modifyitems hooks, so tests
+deselected by them (e.g. --matrix-strength) are not scheduled. Tests marked to
+be skipped (e.g. benchmarks without --benchmark) take no time, they are left
+out of scheduling and kept in the first shard only.
+"""
+from statistics import median
+
+import pytest
+
+DEFAULT_DURATION = 60.0
+FAILED_VALUE = 3
+NEW_VALUE = 2
+BALANCE_ROUNDS = 100
+
+
+def group_key(nodeid):
+    """Return the group of the test, i.e. its module."""
+    return nodeid.split("::", 1)[0]
+
+
+def estimate(tests, durations):
+    """Return durations of tests, estimating the unknown ones."""
+    known = [durations[t] for t in tests if t in durations]
+    default = median(known) if known else DEFAULT_DURATION
+    return {t: durations.get(t, default) for t in tests}
+
+
+def groups(tests):
+    """Return dictionary mapping group keys to their tests, in collection
+    order."""
+    result = {}
+    for test in tests:
+        result.setdefault(group_key(test), []).append(test)
+    return result
+
+
+def _balance(shards, cost):
+    """Move or swap groups between the longest and the shortest shard while
+    it shortens the longest one."""
+    for _ in range(BALANCE_ROUNDS):
+        totals = [sum(cost[g] for g in s) for s in shards]
+        high = max(range(len(shards)), key=totals.__getitem__)
+        low = min(range(len(shards)), key=totals.__getitem__)
+        gap = totals[high] - totals[low]
+        best = None
+        # moving group g (or swapping it with h) changes the longest shard
+        # by delta, which has to be within (0, gap)
+        for g in shards[high]:
+            for h in [None, *shards[low]]:
+                delta = cost[g] - (cost[h] if h is not None else 0)
+                if 0 < delta < gap and (best is None
+                                        or abs(gap - 2 * delta)
+                                        < abs(gap - 2 * best[0])):
+                    best = (delta, g, h)
+        if best is None:
+            return shards
+        _, g, h = best
+        shards[high].remove(g)
+        shards[low].append(g)
+        if h is not None:
+            shards[low].remove(h)
+            shards[high].append(h)
+    return shards
+
+
+def lpt(cost, count):
+    """
+    Assign groups to shards, longest processing time first with tail
+    balancing.
+
+    :param cost: dictionary mapping group keys to durations
+    :param count: number of shards
+    :return: list of lists of group keys
+    """
+    shards = [[] for _ in range(count)]
+    totals = [0.0] * count
+    for key in sorted(cost, key=cost.get, reverse=True):
+        index = min(range(count), key=totals.__getitem__)
+        shards[index].append(key)
+        totals[index] += cost[key]
+    return _balance(shards, cost)
+
+
+def shard(tests, durations, count):
+    """
+    Split tests into count shards with similar total duration.
+
+    :param tests: list of test node IDs in collection order
+    :param durations: dictionary mapping node IDs to durations in seconds
+    :param count: number of shards
+    :return: list of lists of node IDs, in collection order within a shard
+    """
+    estimates = estimate(tests, durations)
+    grouped = groups(tests)
+    cost = {k: sum(estimates[t] for t in v) for k, v in grouped.items()}
+    order = {test: index for index, test in enumerate(tests)}
+    return [sorted((t for key in keys for t in grouped[key]), key=order.get)
+            for keys in lpt(cost, count)]
+
+
+def longest_first(tests, durations):
+    """Return tests with groups ordered from the longest one."""
+    estimates = estimate(tests, durations)
+    grouped = groups(tests)
+    return [t for key in sorted(grouped, reverse=True,
+                                key=lambda k: sum(estimates[t]
+                                                  for t in grouped[k]))
+            for t in grouped[key]]
+
+
+def within_budget(tests, durations, outcomes, budget):
+    """
+    Select the most valuable tests fitting into the budget.
+
+    :param tests: list of test node IDs
+    :param durations: dictionary mapping node IDs to durations in seconds
+    :param outcomes: dictionary mapping node IDs to outcomes of their last run
+    :param budget: wall-clock budget in seconds
+    :return: selected tests in the original order
+    """
+    estimates = estimate(tests, durations)
+
+    def value(test):
+        if test not in durations:
+            return NEW_VALUE
+        return FAILED_VALUE if outcomes.get(test) == "failed" else 1
+
+    selected = set()
+    spent = 0.0
+    for test in sorted(tests, reverse=True,
+                       key=lambda t: value(t) / max(estimates[t], 0.001)):
+        if spent + estimates[test] <= budget:
+            selected.add(test)
+            spent += estimates[test]
+    return [t for t in tests if t in selected]
+
+
+def _skipped(item):
+    """Return True if the test is unconditionally marked to be skipped."""
+    if item.get_closest_marker("skip"):
+        return True
+    for mark in item.iter_markers("skipif"):
+        conditions = mark.args or (mark.kwargs.get("condition"),)
+        # conditions given as strings are evaluated by pytest only when the
+        # test runs
+        if any(c is True for c in conditions):
+            return True
+    return False
+
+
+class Scheduler:
+    """Pytest plugin selecting and ordering tests by recorded durations."""
+
+    def __init__(self, durations, outcomes=None, shard=None,
+                 longest_first=False, budget=None):
+        """
+        :param durations: dictionary mapping node IDs to durations
+        :param outcomes: dictionary mapping node IDs to last outcomes
+        :param shard: tuple (index, count) with 1-based index of the shard to
+                      run or None
+        :param longest_first: order groups from the longest one
+        :param budget: wall-clock budget in seconds or None
+        """
+        self.durations = durations
+        self.outcomes = outcomes or {}
+        self.shard = shard
+        self.longest_first = longest_first
+        self.budget = budget
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, config, items):
+        by_id = {item.nodeid: item for item in items}
+        skipped = [item.nodeid for item in items if _skipped(item)]
+        tests = [item.nodeid for item in items if not _skipped(item)]
+        if self.shard:
+            index, count = self.shard
+            tests = shard(tests, self.durations, count)[index - 1]
+            if index != 1:
+                skipped = []
+        if self.budget is not None:
+            tests = within_budget(tests, self.durations, self.outcomes,
+                                  self.budget)
+        if self.longest_first:
+            tests = longest_first(tests, self.durations)
+        tests += skipped
+        kept = set(tests)
+        deselected = [item for item in items if item.nodeid not in kept]
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+        items[:] = [by_id[t] for t in tests]
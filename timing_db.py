@@ -0,0 +1,269 @@
+"""Historical database of test timings and detection of slowdowns.
+
+With --timing-db, per-test and per-phase durations measured by PhaseTimer are
+stored at the end of the session in a SQLite database. Each run is tagged with
+the host, distribution (ID and version as reported by the distro package, the
+same values isDistro compares) and versions of sssd, gdm and opensc packages.
+
+Slowdowns of a run against the trailing baseline (previous runs on the same
+host and distribution) are reported by:
+
+    python timing_db.py report timings.db [--run ID] [--baseline 10]
+
+A phase of a passed test is flagged when its duration is more than
+``--z-score`` standard deviations above the baseline mean and at least
+``--min-slowdown`` slower than the mean. The command exits with 1 if anything
+is flagged, so it can be used in nightly jobs.
+"""
+import argparse
+import logging
+import platform
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime, timezone
+from statistics import mean, median, stdev
+
+import distro
+
+log = logging.getLogger("PyTest")
+
+PACKAGES = ("sssd", "gdm", "opensc")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    host TEXT NOT NULL,
+    distro TEXT,
+    distro_version TEXT,
+    sssd TEXT,
+    gdm TEXT,
+    opensc TEXT
+);
+CREATE TABLE IF NOT EXISTS timings (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    test TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    duration REAL NOT NULL,
+    count INTEGER NOT NULL,
+    outcome TEXT
+);
+CREATE INDEX IF NOT EXISTS timings_test ON timings(test, phase);
+"""
+
+
+def package_version(name):
+    """Return version-release of installed RPM package or None."""
+    try:
+        out = subprocess.run(
+            ["rpm", "-q", "--qf", "%{VERSION}-%{RELEASE}", name],
+            capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def platform_tags():
+    """Return tags describing the host the tests are executed on."""
+    tags = {
+        "host": platform.node(),
+        "distro": distro.id() or None,
+        "distro_version": distro.version() or None,
+    }
+    for name in PACKAGES:
+        tags[name] = package_version(name)
+    return tags
+
+
+class TimingDB:
+    """SQLite database of timings of test runs."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def add_run(self, results, tags=None):
+        """
+        Store timings of one run.
+
+        :param results: timings as returned by PhaseTimer.to_dict
+        :param tags: dictionary with host, distro, distro_version and package
+                     versions, detected on this host by default
+        :return: ID of the run
+        """
+        tags = tags or platform_tags()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (timestamp, host, distro, distro_version, "
+                "sssd, gdm, opensc) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now(timezone.utc).isoformat(), tags["host"],
+                 tags.get("distro"), tags.get("distro_version"),
+                 *(tags.get(name) for name in PACKAGES)))
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO timings VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, test, phase, duration, r["counts"][phase],
+                  r["outcome"])
+                 for test, r in results.items()
+                 for phase, duration in r["phases"].items()])
+        return run_id
+
+    def run(self, run_id=None):
+        """Return the run with given ID or the latest one."""
+        if run_id is None:
+            return self.connection.execute(
+                "SELECT * FROM runs ORDER BY id DESC LIMIT 1").fetchone()
+        return self.connection.execute(
+            "SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+
+    def durations(self, last=10):
+        """
+        Return typical wall time of tests.
+
+        :param last: number of latest runs to take into account
+        :return: dictionary mapping test node IDs to median of setup + call +
+                 teardown durations in seconds
+        """
+        samples = {}
+        for row in self.connection.execute(
+                "SELECT test, run_id, SUM(duration) AS total FROM timings "
+                "WHERE phase IN ('setup', 'call', 'teardown') AND run_id IN "
+                "(SELECT id FROM runs ORDER BY id DESC LIMIT ?) "
+                "GROUP BY test, run_id", (last,)):
+            samples.setdefault(row["test"], []).append(row["total"])
+        return {test: median(totals) for test, totals in samples.items()}
+
+    def outcomes(self):
+        """Return dictionary mapping tests to outcomes of their last run."""
+        return {row["test"]: row["outcome"] for row in self.connection.execute(
+            "SELECT t.test, t.outcome FROM timings AS t JOIN "
+            "(SELECT test, MAX(run_id) AS run_id FROM timings GROUP BY test) "
+            "AS last ON t.test = last.test AND t.run_id = last.run_id "
+            "GROUP BY t.test")}
+
+    def regressions(self, run_id=None, baseline=10, z_score=3.0,
+                    min_slowdown=0.1, min_samples=5):
+        """
+        Find phases of passed tests that are significantly slower in the run
+        than in the trailing baseline.
+
+        :param run_id: ID of the checked run, the latest one by default
+        :param baseline: number of previous runs on the same host and
+                         distribution used as the baseline
+        :param z_score: how many standard deviations above the baseline mean
+                        the duration has to be
+        :param min_slowdown: minimal relative slowdown against the mean
+        :param min_samples: minimal number of baseline durations of the phase
+        :return: list of dictionaries describing the slowdowns
+        """
+        run = self.run(run_id)
+        if run is None:
+            return []
+        baseline_runs = [r["id"] for r in self.connection.execute(
+            "SELECT id FROM runs WHERE id < ? AND host = ? "
+            "AND distro IS ? AND distro_version IS ? "
+            "ORDER BY id DESC LIMIT ?",
+            (run["id"], run["host"], run["distro"], run["distro_version"],
+             baseline))]
+        if not baseline_runs:
+            return []
+
+        history = {}
+        placeholders = ", ".join("?" * len(baseline_runs))
+        for row in self.connection.execute(
+                "SELECT test, phase, duration FROM timings "
+                f"WHERE run_id IN ({placeholders}) AND outcome = 'passed'",
+                baseline_runs):
+            history.setdefault((row["test"], row["phase"]), []) \
+                .append(row["duration"])
+
+        found = []
+        for row in self.connection.execute(
+                "SELECT test, phase, duration FROM timings "
+                "WHERE run_id = ? AND outcome = 'passed'", (run["id"],)):
+            durations = history.get((row["test"], row["phase"]), [])
+            if len(durations) < min_samples:
+                continue
+            average, deviation = mean(durations), stdev(durations)
+            if row["duration"] < average * (1 + min_slowdown):
+                continue
+            score = ((row["duration"] - average) / deviation
+                     if deviation else float("inf"))
+            if score < z_score:
+                continue
+            found.append({"test": row["test"], "phase": row["phase"],
+                          "duration": row["duration"], "mean": average,
+                          "stdev": deviation, "z_score": score,
+                          "samples": len(durations)})
+        return found
+
+    def close(self):
+        self.connection.close()
+
+
+class TimingRecorder:
+    """Pytest plugin storing timings of PhaseTimer in TimingDB."""
+
+    def __init__(self, path, timer):
+        self.path = path
+        self.timer = timer
+
+    def pytest_sessionfinish(self, session):
+        db = TimingDB(self.path)
+        try:
+            run_id = db.add_run(self.timer.to_dict())
+            log.info("Timings of run %s are stored in %s", run_id, self.path)
+            for r in db.regressions(run_id):
+                log.warning("Slowdown of %s in %s: %.3f s, baseline "
+                            "%.3f +- %.3f s", r["phase"], r["test"],
+                            r["duration"], r["mean"], r["stdev"])
+        finally:
+            db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report = subparsers.add_parser(
+        "report", help="Report slowdowns of a run against the baseline")
+    report.add_argument("db", help="Path to the timing database")
+    report.add_argument("--run", type=int, default=None,
+                        help="ID of the run, default is the latest one")
+    report.add_argument("--baseline", type=int, default=10,
+                        help="Number of previous runs in the baseline")
+    report.add_argument("--z-score", type=float, default=3.0,
+                        help="Minimal number of standard deviations above "
+                             "the baseline mean")
+    report.add_argument("--min-slowdown", type=float, default=0.1,
+                        help="Minimal relative slowdown, e.g. 0.1 for 10 %%")
+    report.add_argument("--min-samples", type=int, default=5,
+                        help="Minimal number of baseline samples of a phase")
+    args = parser.parse_args(argv)
+
+    db = TimingDB(args.db)
+    try:
+        run = db.run(args.run)
+        if run is None:
+            print("No such run", file=sys.stderr)
+            return 2
+        found = db.regressions(run["id"], args.baseline, args.z_score,
+                               args.min_slowdown, args.min_samples)
+    finally:
+        db.close()
+
+    print(f"Run {run['id']} ({run['timestamp']}) on {run['host']}, "
+          f"{run['distro']} {run['distro_version']}, "
+          + ", ".join(f"{name} {run[name]}" for name in PACKAGES))
+    for r in sorted(found, key=lambda r: r["z_score"], reverse=True):
+        print(f"SLOWER {r['test']} [{r['phase']}]: {r['duration']:.3f} s, "
+              f"baseline {r['mean']:.3f} +- {r['stdev']:.3f} s "
+              f"(n={r['samples']}, z={r['z_score']:.1f})")
+    if not found:
+        print("No significant slowdowns")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
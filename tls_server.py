@@ -0,0 +1,106 @@
+"""HTTPS server requiring TLS client authentication, for use in fixtures."""
+import logging
+import ssl
+import threading
+from collections import namedtuple
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+log = logging.getLogger("PyTest")
+
+Handshake = namedtuple("Handshake", "start end reused")
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        log.debug("%s: %s", self.address_string(), format % args)
+
+
+class TLSServer(ThreadingHTTPServer):
+    """
+    Threaded HTTPS server that requires a client certificate signed by
+    ``ca_cert``.
+
+    The socket is bound and listening when the object is created, so clients
+    can connect as soon as ``start`` returns. TLS handshakes are done in the
+    per-connection threads, not in the accepting one, so the server handles
+    concurrent handshakes.
+
+    Completed handshakes are recorded in ``handshakes`` (start and end
+    ``time.perf_counter`` values and whether the session was resumed), the
+    number of failed ones in ``failed_handshakes``.
+
+        with TLSServer(("127.0.0.1", 8888), cert, key, ca_cert) as server:
+            ...
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, cert, key, ca_cert,
+                 min_version=ssl.TLSVersion.TLSv1_2,
+                 max_version=ssl.TLSVersion.TLSv1_2,
+                 handler=_Handler):
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(certfile=str(cert), keyfile=str(key))
+        self.context.load_verify_locations(cafile=str(ca_cert))
+        self.context.verify_mode = ssl.CERT_REQUIRED
+        self.context.minimum_version = min_version
+        self.context.maximum_version = max_version
+        self.ready = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+        super().__init__(address, handler)
+
+    def server_activate(self):
+        super().server_activate()
+        self.socket = self.context.wrap_socket(self.socket, server_side=True,
+                                               do_handshake_on_connect=False)
+        self.ready.set()
+        log.debug("TLS server is listening on %s:%s", *self.server_address)
+
+    def reset_stats(self):
+        """Forget recorded handshakes."""
+        with self._stats_lock:
+            self.handshakes = []
+            self.failed_handshakes = 0
+
+    def finish_request(self, request, client_address):
+        start = perf_counter()
+        try:
+            request.do_handshake()
+        except OSError:
+            with self._stats_lock:
+                self.failed_handshakes += 1
+            raise
+        with self._stats_lock:
+            self.handshakes.append(
+                Handshake(start, perf_counter(), request.session_reused))
+        super().finish_request(request, client_address)
+
+    def handle_error(self, request, client_address):
+        log.debug("Connection from %s:%s failed", *client_address,
+                  exc_info=True)
+
+    def start(self):
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(name="tls_server",
+                                        target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        self.ready.wait()
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
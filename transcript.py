@@ -0,0 +1,104 @@
+"""Bounded capture of transcripts of pexpect shells.
+
+Shells log their output to ``current()`` instead of stdout. While a test runs,
+it is the Transcript of the test: the output is compressed on the fly to
+``<transcript dir>/<test>.log.gz`` (--transcript-dir, transcripts directory
+of the pytest cache by default) and only the last --transcript-tail
+characters are kept in memory. When the test fails, the tail is attached to
+the failure report as the "Shell transcript" section. Read a whole transcript
+with ``zcat`` or ``zless``.
+"""
+import gzip
+import re
+import sys
+import threading
+from collections import deque
+from pathlib import Path
+
+import pytest
+
+TAIL_SIZE = 64 * 1024
+
+_current = None
+
+
+def current():
+    """Return the sink for shell output of the running test, or stdout
+    outside of tests."""
+    return _current if _current is not None else sys.stdout
+
+
+class Transcript:
+    """File-like object writing to a gzip file and keeping a bounded tail."""
+
+    def __init__(self, path, tail_size=TAIL_SIZE):
+        self.path = path
+        self.tail_size = tail_size
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._tail = deque()
+        self._tail_length = 0
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        with self._lock:
+            self._file.write(data)
+            self._tail.append(data)
+            self._tail_length += len(data)
+            # drop the oldest chunks not needed for the last tail_size
+            # characters, the newest one is always kept
+            while len(self._tail) > 1 and (self._tail_length
+                                           - len(self._tail[0])
+                                           >= self.tail_size):
+                self._tail_length -= len(self._tail.popleft())
+        return len(data)
+
+    def flush(self):
+        # called by pexpect after every write, the output stays in the gzip
+        # buffer so it is compressed in larger blocks
+        pass
+
+    def sync(self):
+        """Write all buffered output to the file."""
+        with self._lock:
+            self._file.flush()
+
+    def tail(self):
+        """Return the last tail_size characters."""
+        with self._lock:
+            return "".join(self._tail)[-self.tail_size:]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class TranscriptCapture:
+    """Pytest plugin giving each test its own transcript."""
+
+    def __init__(self, directory, tail_size=TAIL_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.tail_size = tail_size
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        global _current
+        name = re.sub(r"[^\w.-]+", "_", item.nodeid)
+        _current = Transcript(self.directory.joinpath(f"{name}.log.gz"),
+                              self.tail_size)
+        try:
+            yield
+        finally:
+            _current.close()
+            _current = None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        if report.failed and _current is not None:
+            _current.sync()
+            report.sections.append(
+                ("Shell transcript",
+                 f"last {self.tail_size} characters of "
+                 f"{_current.path}:\n{_current.tail()}"))